@@ -1,17 +1,18 @@
 #!/bin/bash
 # Скрипт для резервного копирования базы данных
+# Использует SQLite backup API: снимок согласован и бота останавливать не нужно
+
+cd "$(dirname "$0")"
 
 DB_FILE="income_bot.db"
-BACKUP_DIR="backups"
-TIMESTAMP=$(date +%Y%m%d_%H%M%S)
-BACKUP_FILE="$BACKUP_DIR/income_bot_${TIMESTAMP}.db"
 
-# Создаем директорию для бэкапов
-mkdir -p "$BACKUP_DIR"
+if [ -d "venv" ]; then
+    source venv/bin/activate
+fi
 
 if [ -f "$DB_FILE" ]; then
     echo "📦 Создание резервной копии базы данных..."
-    cp "$DB_FILE" "$BACKUP_FILE"
+    BACKUP_FILE=$(python3 backup.py) || { echo "❌ Ошибка резервного копирования"; exit 1; }
     echo "✅ Резервная копия создана: $BACKUP_FILE"
     echo ""
     echo "Размер файла:"
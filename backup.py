@@ -0,0 +1,134 @@
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько страниц копировать за один шаг и сколько ждать между шагами.
+# Между шагами блокировка на чтение снимается, и бот может писать в базу.
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE = 0.01
+
+# Сколько последних снимков хранить
+BACKUP_KEEP = 14
+
+# Интервал автоматического резервного копирования (в секундах)
+BACKUP_INTERVAL = 24 * 60 * 60
+
+
+class BackupError(Exception):
+    """Ошибка создания резервной копии"""
+
+
+class BackupManager:
+    def __init__(self, db_name: str = "income_bot.db", backup_dir: str = "backups",
+                 keep: int = BACKUP_KEEP):
+        self.db_name = db_name
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def create_backup(self) -> str:
+        """Создать сжатый снимок базы данных и вернуть путь к нему"""
+        # Плановая задача и /backup не должны копировать одновременно
+        with self._lock:
+            return self._create_backup()
+
+    def _create_backup(self) -> str:
+        os.makedirs(self.backup_dir, exist_ok=True)
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base_name = os.path.splitext(os.path.basename(self.db_name))[0]
+        archive_path = os.path.join(self.backup_dir, f"{base_name}_{timestamp}.db.gz")
+
+        # Уникальные временные файлы: backup-db.sh может работать параллельно с ботом
+        fd, snapshot_path = tempfile.mkstemp(prefix=f"{base_name}_", suffix=".db.tmp", dir=self.backup_dir)
+        os.close(fd)
+        fd, archive_tmp_path = tempfile.mkstemp(prefix=f"{base_name}_", suffix=".gz.tmp", dir=self.backup_dir)
+        os.close(fd)
+
+        try:
+            self._copy_online(snapshot_path)
+            self._check_integrity(snapshot_path)
+            self._compress(snapshot_path, archive_tmp_path)
+            os.replace(archive_tmp_path, archive_path)
+        finally:
+            for path in (snapshot_path, archive_tmp_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        self.apply_retention()
+        logger.info(f"Резервная копия создана: {archive_path}")
+        return archive_path
+
+    def _copy_online(self, snapshot_path: str):
+        """Скопировать базу через SQLite backup API небольшими порциями страниц"""
+        def progress(status, remaining, total):
+            # Пауза между шагами отдает базу пишущим обработчикам
+            if remaining:
+                time.sleep(BACKUP_STEP_PAUSE)
+
+        source = sqlite3.connect(self.db_name)
+        target = sqlite3.connect(snapshot_path)
+        try:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=progress)
+        finally:
+            target.close()
+            source.close()
+
+    def _check_integrity(self, snapshot_path: str):
+        """Проверить целостность снимка"""
+        conn = sqlite3.connect(snapshot_path)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchone()
+        finally:
+            conn.close()
+
+        if not result or result[0] != "ok":
+            raise BackupError(f"Снимок не прошел проверку целостности: {result}")
+
+    def _compress(self, snapshot_path: str, archive_path: str):
+        """Сжать снимок в gzip"""
+        with open(snapshot_path, "rb") as src, gzip.open(archive_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+
+    def list_backups(self) -> List[str]:
+        """Получить список снимков, от новых к старым"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+
+        base_name = os.path.splitext(os.path.basename(self.db_name))[0]
+        backups = [
+            os.path.join(self.backup_dir, name)
+            for name in os.listdir(self.backup_dir)
+            if name.startswith(f"{base_name}_") and name.endswith(".db.gz")
+        ]
+        return sorted(backups, reverse=True)
+
+    def apply_retention(self) -> List[str]:
+        """Удалить старые снимки сверх лимита хранения"""
+        removed = []
+        for path in self.list_backups()[self.keep:]:
+            os.remove(path)
+            removed.append(path)
+        return removed
+
+    def latest_backup(self) -> Optional[str]:
+        """Получить путь к последнему снимку"""
+        backups = self.list_backups()
+        return backups[0] if backups else None
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    print(BackupManager().create_backup())
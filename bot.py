@@ -1,7 +1,10 @@
+import asyncio
+import html
 import logging
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.error import Conflict, NetworkError
+from telegram.error import Conflict, NetworkError, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -9,10 +12,23 @@ from telegram.ext import (
     MessageHandler,
     ContextTypes,
     ConversationHandler,
+    TypeHandler,
     filters
 )
 from dateutil import parser as date_parser
-from database import Database
+from database import Database, MAX_AMOUNT
+from backup import BackupManager, BACKUP_INTERVAL
+from recurring import describe_schedule, parse_schedule
+from state import CONVERSATION_TIMEOUT, STATE_SWEEP_INTERVAL, StateManager
+from tracing import TraceRecorder
+from digest import (
+    DIGEST_CATCHUP_DAYS,
+    DIGEST_WEEKLY,
+    deliver_pending_digests,
+    prepare_digest,
+    previous_month_period,
+    previous_week_period,
+)
 
 # Настройка логирования
 logging.basicConfig(
@@ -28,45 +44,145 @@ logging.getLogger('httpx').setLevel(logging.WARNING)
 logging.getLogger('telegram.ext._conversationhandler').setLevel(logging.ERROR)
 
 # Состояния для ConversationHandler
-WAITING_AMOUNT, WAITING_DATE, WAITING_CATEGORY_NAME = range(3)
+(
+    WAITING_AMOUNT,
+    WAITING_DATE,
+    WAITING_CATEGORY_NAME,
+    WAITING_GROUP_NAME,
+    WAITING_GROUP_CATEGORY_NAME,
+    WAITING_RECURRING_AMOUNT,
+    WAITING_RECURRING_SCHEDULE,
+    WAITING_BUDGET_AMOUNT,
+) = range(8)
+
+# Для чего выбирается категория (часть callback_data выбора категории)
+PICKER_ADD, PICKER_RECURRING, PICKER_BUDGET = "a", "r", "b"
+
+PICKER_TITLES = {
+    PICKER_ADD: "Выберите категорию:",
+    PICKER_RECURRING: "Выберите категорию регулярного дохода:",
+    PICKER_BUDGET: "Выберите категорию для цели:",
+}
+
+PICKER_BACK = {
+    PICKER_ADD: "back_to_main",
+    PICKER_RECURRING: "recurring",
+    PICKER_BUDGET: "budgets",
+}
+
+# Интервал проверки регулярных правил (в секундах)
+RECURRING_CHECK_INTERVAL = 3600
+
+# Время месячной рассылки дайджестов (1-го числа)
+MONTHLY_DIGEST_TIME = time(10, 0)
+
+# Названия месяцев на русском
+MONTH_NAMES = {
+    1: "Январь", 2: "Февраль", 3: "Март", 4: "Апрель",
+    5: "Май", 6: "Июнь", 7: "Июль", 8: "Август",
+    9: "Сентябрь", 10: "Октябрь", 11: "Ноябрь", 12: "Декабрь"
+}
 
 # Инициализация базы данных
 db = Database()
 
+# Резервное копирование базы данных
+backup_manager = BackupManager(db.db_name)
+
+# Ограничение памяти под данные пользователей и незавершенные диалоги
+state_manager = StateManager()
+
 
 def get_main_keyboard():
     """Главная клавиатура с кнопками"""
     keyboard = [
         [InlineKeyboardButton("➕ Добавить", callback_data="add")],
         [InlineKeyboardButton("📊 Статистика", callback_data="statistics")],
+        [InlineKeyboardButton("👥 Группы", callback_data="groups")],
+        [InlineKeyboardButton("🔁 Регулярные доходы", callback_data="recurring")],
+        [InlineKeyboardButton("🎯 Цели на месяц", callback_data="budgets")],
         [InlineKeyboardButton("🗑️ Удалить запись", callback_data="delete")]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 
-def get_categories_keyboard(user_id: int, include_add_category: bool = True):
-    """Клавиатура с категориями"""
-    categories = db.get_categories(user_id)
+def get_category_buttons(categories, purpose: str, label: str = ""):
+    """Кнопки категорий по 2 в ряд (в callback_data только ID категории)"""
     keyboard = []
-    
-    # Кнопки категорий по 2 в ряд
     for i in range(0, len(categories), 2):
-        row = []
-        row.append(InlineKeyboardButton(categories[i], callback_data=f"category_{categories[i]}"))
-        if i + 1 < len(categories):
-            row.append(InlineKeyboardButton(categories[i + 1], callback_data=f"category_{categories[i + 1]}"))
-        keyboard.append(row)
+        keyboard.append([
+            InlineKeyboardButton(f"{label}{name}", callback_data=f"cat_{purpose}_{category_id}")
+            for category_id, name in categories[i:i + 2]
+        ])
+    return keyboard
+
+
+def get_categories_keyboard(user_id: int, purpose: str = PICKER_ADD, page: int = 0, search: str = None):
+    """Клавиатура выбора категории: недавние, постраничный список и поиск по началу названия"""
+    keyboard = []
+    
+    # Недавно использованные категории - на первой странице без поиска
+    if page == 0 and not search:
+        keyboard += get_category_buttons(db.get_recent_categories(user_id), purpose, label="⭐ ")
+    
+    categories, has_next = db.get_categories_page(user_id, page, search)
+    keyboard += get_category_buttons(categories, purpose)
+    
+    # Переключение страниц
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("⬅️", callback_data=f"catp_{purpose}_{page - 1}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton("➡️", callback_data=f"catp_{purpose}_{page + 1}"))
+    if navigation:
+        keyboard.append(navigation)
+    
+    if search:
+        keyboard.append([InlineKeyboardButton("✖️ Сбросить поиск", callback_data=f"catq_{purpose}")])
     
     # Кнопка добавления категории
-    if include_add_category:
+    if purpose == PICKER_ADD:
         keyboard.append([InlineKeyboardButton("➕ Добавить категорию", callback_data="add_category")])
     
     # Кнопка назад
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=PICKER_BACK[purpose])])
     
     return InlineKeyboardMarkup(keyboard)
 
 
+def get_categories_text(purpose: str, search: str = None) -> str:
+    """Текст над клавиатурой выбора категории"""
+    text = PICKER_TITLES[purpose]
+    if search:
+        return f"{text}\n\n🔎 Поиск: <b>{html.escape(search)}</b>"
+    return f"{text}\n\nЧтобы найти категорию, отправьте первые буквы ее названия."
+
+
+def get_recurring_text_and_keyboard(user_id: int):
+    """Текст и клавиатура со списком регулярных доходов"""
+    rules = db.get_recurring_rules(user_id)
+    keyboard = []
+    
+    if not rules:
+        text = "🔁 Регулярные доходы\n\nНет правил. Добавьте зарплату или постоянный контракт, и бот будет записывать доход сам."
+    else:
+        text = "🔁 Регулярные доходы\n\n"
+        for i, (rule_id, category, amount, kind, value, next_run) in enumerate(rules, 1):
+            next_date = datetime.strptime(next_run, "%Y-%m-%d").date()
+            text += (
+                f"{i}. <b>{html.escape(category)}</b>: {amount:,.2f} ₽, {describe_schedule(kind, value)}\n"
+                f"    следующая запись: {next_date.strftime('%d.%m.%Y')}\n"
+            )
+            keyboard.append([InlineKeyboardButton(
+                f"🗑️ {i}. {category} - {amount:,.2f} ₽",
+                callback_data=f"recurring_delete_{rule_id}"
+            )])
+    
+    keyboard.append([InlineKeyboardButton("➕ Добавить правило", callback_data="recurring_add")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")])
+    return text, InlineKeyboardMarkup(keyboard)
+
+
 def get_statistics_keyboard():
     """Клавиатура статистики"""
     keyboard = [
@@ -99,6 +215,116 @@ def get_months_keyboard():
     return InlineKeyboardMarkup(keyboard)
 
 
+def get_groups_keyboard(user_id: int):
+    """Клавиатура со списком групп пользователя"""
+    keyboard = [
+        [InlineKeyboardButton(f"👥 {name}", callback_data=f"group_{group_id}")]
+        for group_id, name in db.get_user_groups(user_id)
+    ]
+    keyboard.append([InlineKeyboardButton("➕ Создать группу", callback_data="create_group")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def get_group_keyboard(group_id: int):
+    """Клавиатура группы"""
+    keyboard = [
+        [InlineKeyboardButton("📅 За текущий месяц", callback_data=f"group_month_{group_id}")],
+        [InlineKeyboardButton("📈 Всего", callback_data=f"group_all_{group_id}")],
+        [InlineKeyboardButton("➕ Категория группы", callback_data=f"group_category_{group_id}")],
+        [InlineKeyboardButton("🚪 Выйти из группы", callback_data=f"group_leave_{group_id}")],
+        [InlineKeyboardButton("◀️ Назад", callback_data="groups")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+def get_group_text(group) -> str:
+    """Получить текст экрана группы"""
+    group_id, name, invite_code, members_count = group
+    current_date = datetime.now()
+    month_key = current_date.strftime("%Y-%m")
+
+    month_total = sum(amount for _, amount in db.get_group_statistics(group_id, month_key))
+    total_amount = sum(amount for _, amount in db.get_group_statistics(group_id))
+
+    return (
+        f"👥 <b>{html.escape(name)}</b>\n\n"
+        f"Участников: {members_count}\n"
+        f"Код приглашения: <code>{invite_code}</code>\n"
+        f"(для вступления: /join {invite_code})\n\n"
+        f"📅 За {MONTH_NAMES[current_date.month]} {current_date.year}: <b>{month_total:,.2f} ₽</b>\n"
+        f"💰 Итого за все время: <b>{total_amount:,.2f} ₽</b>"
+    )
+
+
+def get_group_statistics_text(group, month_key: str = None) -> str:
+    """Получить текст статистики группы за месяц (ГГГГ-ММ) или за все время"""
+    group_id, name = group[0], html.escape(group[1])
+    stats = db.get_group_statistics(group_id, month_key)
+
+    if month_key:
+        year, month = (int(part) for part in month_key.split("-"))
+        text = f"👥 <b>{name}</b>: {MONTH_NAMES[month]} {year}\n\n"
+    else:
+        text = f"👥 <b>{name}</b>: общая статистика\n\n"
+
+    if not stats:
+        return text + "Нет данных за этот период."
+
+    total = sum(amount for _, amount in stats)
+    for category, amount in stats:
+        percentage = (amount / total * 100) if total > 0 else 0
+        text += f"<b>{html.escape(category)}</b>: {amount:,.2f} ₽ ({percentage:.1f}%)\n"
+
+    text += "\n<b>Участники:</b>\n"
+    for member_name, amount in db.get_group_member_totals(group_id, month_key):
+        text += f"{html.escape(member_name or '—')}: {amount:,.2f} ₽\n"
+
+    text += f"\n<b>Итого:</b> {total:,.2f} ₽"
+    return text
+
+
+def get_budgets_text_and_keyboard(user_id: int):
+    """Текст и клавиатура со списком целей на месяц"""
+    current_date = datetime.now()
+    targets = db.get_budget_targets(user_id, current_date.strftime("%Y-%m"))
+    keyboard = []
+    
+    text = f"🎯 Цели на {MONTH_NAMES[current_date.month]} {current_date.year}\n\n"
+    if not targets:
+        text += "Нет целей. Бот сообщит, когда доход за месяц достигнет 50% и 100% цели."
+    for category_id, category, target, total in targets:
+        name = category or "Все категории"
+        percentage = total / target * 100 if target > 0 else 0
+        text += f"<b>{html.escape(name)}</b>: {total:,.2f} из {target:,.2f} ₽ ({percentage:.0f}%)\n"
+        keyboard.append([InlineKeyboardButton(
+            f"🗑️ {name} - {target:,.2f} ₽",
+            callback_data=f"budget_delete_{category_id}"
+        )])
+    
+    keyboard.append([InlineKeyboardButton("➕ Общая цель", callback_data="budget_total")])
+    keyboard.append([InlineKeyboardButton("➕ Цель по категории", callback_data="budget_add")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")])
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+async def send_budget_alerts(bot, user_id: int = None):
+    """Отправить накопившиеся уведомления о целях (пользователю или всем)"""
+    alerts = await asyncio.to_thread(db.take_budget_alerts, user_id)
+    
+    for alert_user_id, category, month_key, threshold, target in alerts:
+        year, month = (int(part) for part in month_key.split("-"))
+        name = html.escape(category or "Все категории")
+        if threshold >= 100:
+            text = f"🎉 Цель <b>{name}</b> на {MONTH_NAMES[month]} {year} выполнена: {target:,.2f} ₽!"
+        else:
+            text = f"🎯 Цель <b>{name}</b> на {MONTH_NAMES[month]} {year} выполнена на {threshold}% (цель {target:,.2f} ₽)"
+        try:
+            await bot.send_message(alert_user_id, text, parse_mode='HTML')
+        except TelegramError as e:
+            logger.warning(f"Не удалось отправить уведомление о цели {alert_user_id}: {e}")
+
+
 def get_main_menu_text(user_id: int) -> str:
     """Получить текст главного меню со статистикой"""
     current_date = datetime.now()
@@ -106,7 +332,7 @@ def get_main_menu_text(user_id: int) -> str:
     current_month = current_date.month
     
     # Получаем сумму за текущий месяц (начиная с января 2026)
-    month_total = 0.0
+    month_total = Decimal(0)
     if current_year >= 2026:
         month_total = db.get_month_total(user_id, current_year, current_month)
     
@@ -114,12 +340,7 @@ def get_main_menu_text(user_id: int) -> str:
     total_amount = db.get_total_amount(user_id)
     
     # Название месяца на русском
-    month_names = {
-        1: "Январь", 2: "Февраль", 3: "Март", 4: "Апрель",
-        5: "Май", 6: "Июнь", 7: "Июль", 8: "Август",
-        9: "Сентябрь", 10: "Октябрь", 11: "Ноябрь", 12: "Декабрь"
-    }
-    month_name = month_names.get(current_month, "")
+    month_name = MONTH_NAMES.get(current_month, "")
     
     text = (
         f"📊 <b>Главное меню</b>\n\n"
@@ -134,6 +355,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
     user_id = user.id
+    # Как и "Назад" в главное меню: незавершенный ввод и выбор категории сбрасываются
+    context.user_data.clear()
     
     menu_text = get_main_menu_text(user_id)
     
@@ -142,6 +365,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='HTML',
         reply_markup=get_main_keyboard()
     )
+    return ConversationHandler.END
 
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -152,15 +376,83 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     data = query.data
 
-    if data == "add":
+    # Любая кнопка вне выбора категории закрывает его: текст больше не считается поиском
+    if not data.startswith(("cat_", "catp_", "catq_")):
+        context.user_data.pop('picker', None)
+        context.user_data.pop('picker_search', None)
+
+    if data in ("add", "recurring_add", "budget_add"):
         # Очищаем данные пользователя при возврате к выбору категории
         context.user_data.clear()
+        purpose = {"add": PICKER_ADD, "recurring_add": PICKER_RECURRING, "budget_add": PICKER_BUDGET}[data]
+        context.user_data['picker'] = purpose
         await query.edit_message_text(
-            "Выберите категорию:",
-            reply_markup=get_categories_keyboard(user_id)
+            get_categories_text(purpose),
+            parse_mode='HTML',
+            reply_markup=get_categories_keyboard(user_id, purpose)
         )
         return ConversationHandler.END
     
+    elif data.startswith("catp_") or data.startswith("catq_"):
+        parts = data.split("_")
+        purpose = parts[1]
+        page = int(parts[2]) if data.startswith("catp_") else 0
+        if data.startswith("catq_"):
+            context.user_data.pop('picker_search', None)
+        search = context.user_data.get('picker_search')
+        context.user_data['picker'] = purpose
+        await query.edit_message_text(
+            get_categories_text(purpose, search),
+            parse_mode='HTML',
+            reply_markup=get_categories_keyboard(user_id, purpose, page, search)
+        )
+    
+    elif data.startswith("cat_"):
+        _, purpose, category_id = data.split("_")
+        category_id = int(category_id)
+        category_name = db.get_category(user_id, category_id)
+        
+        if not category_name:
+            await query.answer("Категория не найдена!", show_alert=True)
+            return ConversationHandler.END
+        
+        context.user_data.pop('picker', None)
+        context.user_data.pop('picker_search', None)
+        context.user_data['selected_category'] = category_name
+        context.user_data['selected_category_id'] = category_id
+        
+        if purpose == PICKER_RECURRING:
+            await query.edit_message_text(
+                f"Категория: <b>{html.escape(category_name)}</b>\n\n"
+                "Введите сумму регулярного дохода:",
+                parse_mode='HTML',
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("◀️ Отмена", callback_data="recurring")
+                ]])
+            )
+            return WAITING_RECURRING_AMOUNT
+        
+        if purpose == PICKER_BUDGET:
+            await query.edit_message_text(
+                f"Цель: <b>{html.escape(category_name)}</b>\n\n"
+                "Введите сумму дохода, которую хотите получать за месяц:",
+                parse_mode='HTML',
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("◀️ Отмена", callback_data="budgets")
+                ]])
+            )
+            return WAITING_BUDGET_AMOUNT
+        
+        await query.edit_message_text(
+            f"Категория: <b>{html.escape(category_name)}</b>\n\n"
+            "Введите сумму дохода:",
+            parse_mode='HTML',
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("◀️ Назад", callback_data="add")
+            ]])
+        )
+        return WAITING_AMOUNT
+    
     elif data == "statistics":
         await query.edit_message_text(
             "Выберите тип статистики:",
@@ -187,18 +479,112 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_CATEGORY_NAME
     
-    elif data.startswith("category_"):
-        category_name = data.replace("category_", "")
-        context.user_data['selected_category'] = category_name
+    elif data == "groups":
+        context.user_data.clear()
         await query.edit_message_text(
-            f"Категория: <b>{category_name}</b>\n\n"
-            "Введите сумму дохода:",
+            "👥 Группы\n\n"
+            "Группа объединяет учет нескольких аккаунтов: участники видят общие "
+            "категории и общую статистику.\n"
+            "Чтобы вступить в группу, отправьте /join КОД.",
+            reply_markup=get_groups_keyboard(user_id)
+        )
+        return ConversationHandler.END
+    
+    elif data == "create_group":
+        await query.edit_message_text(
+            "Введите название новой группы:",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("◀️ Отмена", callback_data="groups")
+            ]])
+        )
+        return WAITING_GROUP_NAME
+    
+    elif data.startswith("group_"):
+        action, _, group_id = data.replace("group_", "").rpartition("_")
+        group = db.get_group(int(group_id), user_id)
+        
+        if not group:
+            await query.edit_message_text(
+                "Группа не найдена.",
+                reply_markup=get_groups_keyboard(user_id)
+            )
+            return ConversationHandler.END
+        
+        if action == "month":
+            await query.edit_message_text(
+                get_group_statistics_text(group, datetime.now().strftime("%Y-%m")),
+                parse_mode='HTML',
+                reply_markup=get_group_keyboard(group[0])
+            )
+        elif action == "all":
+            await query.edit_message_text(
+                get_group_statistics_text(group),
+                parse_mode='HTML',
+                reply_markup=get_group_keyboard(group[0])
+            )
+        elif action == "category":
+            context.user_data['group_id'] = group[0]
+            await query.edit_message_text(
+                f"Группа: <b>{html.escape(group[1])}</b>\n\n"
+                "Введите название категории группы:",
+                parse_mode='HTML',
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("◀️ Отмена", callback_data=f"group_{group[0]}")
+                ]])
+            )
+            return WAITING_GROUP_CATEGORY_NAME
+        elif action == "leave":
+            db.leave_group(group[0], user_id)
+            await query.edit_message_text(
+                f"🚪 Вы вышли из группы <b>{html.escape(group[1])}</b>.",
+                parse_mode='HTML',
+                reply_markup=get_groups_keyboard(user_id)
+            )
+        else:
+            context.user_data.clear()
+            await query.edit_message_text(
+                get_group_text(group),
+                parse_mode='HTML',
+                reply_markup=get_group_keyboard(group[0])
+            )
+    
+    elif data == "recurring":
+        context.user_data.clear()
+        text, keyboard = get_recurring_text_and_keyboard(user_id)
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=keyboard)
+        return ConversationHandler.END
+    
+    elif data.startswith("recurring_delete_"):
+        rule_id = int(data.replace("recurring_delete_", ""))
+        if not db.delete_recurring_rule(rule_id, user_id):
+            await query.answer("Правило не найдено!", show_alert=True)
+        text, keyboard = get_recurring_text_and_keyboard(user_id)
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=keyboard)
+    
+    elif data == "budgets":
+        context.user_data.clear()
+        text, keyboard = get_budgets_text_and_keyboard(user_id)
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=keyboard)
+        return ConversationHandler.END
+    
+    elif data == "budget_total":
+        context.user_data['selected_category'] = None
+        context.user_data['selected_category_id'] = 0
+        await query.edit_message_text(
+            "Цель: <b>Все категории</b>\n\n"
+            "Введите сумму дохода, которую хотите получать за месяц:",
             parse_mode='HTML',
             reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("◀️ Назад", callback_data="add")
+                InlineKeyboardButton("◀️ Отмена", callback_data="budgets")
             ]])
         )
-        return WAITING_AMOUNT
+        return WAITING_BUDGET_AMOUNT
+    
+    elif data.startswith("budget_delete_"):
+        category_id = int(data.replace("budget_delete_", ""))
+        db.delete_budget_target(user_id, category_id)
+        text, keyboard = get_budgets_text_and_keyboard(user_id)
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=keyboard)
     
     elif data == "stats_monthly":
         await query.edit_message_text(
@@ -219,7 +605,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text = f"📅 Статистика за {datetime(year, month, 1).strftime('%B %Y')}\n\n"
             for category, amount in stats:
                 percentage = (amount / total * 100) if total > 0 else 0
-                text += f"<b>{category}</b>: {amount:,.2f} ₽ ({percentage:.1f}%)\n"
+                text += f"<b>{html.escape(category)}</b>: {amount:,.2f} ₽ ({percentage:.1f}%)\n"
             text += f"\n<b>Итого:</b> {total:,.2f} ₽"
         
         await query.edit_message_text(
@@ -238,7 +624,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text = "📈 Общая статистика\n\n"
             for category, amount in stats:
                 percentage = (amount / total * 100) if total > 0 else 0
-                text += f"<b>{category}</b>: {amount:,.2f} ₽ ({percentage:.1f}%)\n"
+                text += f"<b>{html.escape(category)}</b>: {amount:,.2f} ₽ ({percentage:.1f}%)\n"
             text += f"\n<b>Итого:</b> {total:,.2f} ₽"
         
         await query.edit_message_text(
@@ -291,7 +677,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Показываем подтверждение удаления
         await query.edit_message_text(
             f"⚠️ Подтвердите удаление:\n\n"
-            f"Категория: <b>{category}</b>\n"
+            f"Категория: <b>{html.escape(category)}</b>\n"
             f"Сумма: <b>{amount:,.2f} ₽</b>\n"
             f"Дата: <b>{date_obj.strftime('%d.%m.%Y')}</b>",
             parse_mode='HTML',
@@ -312,7 +698,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             menu_text = get_main_menu_text(user_id)
             await query.edit_message_text(
                 f"✅ Запись удалена!\n\n"
-                f"Категория: <b>{category}</b>\n"
+                f"Категория: <b>{html.escape(category)}</b>\n"
                 f"Сумма: <b>{amount:,.2f} ₽</b>\n"
                 f"Дата: <b>{date_obj.strftime('%d.%m.%Y')}</b>\n\n"
                 f"{menu_text}",
@@ -331,10 +717,37 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+def parse_amount(text: str) -> Decimal:
+    """Разобрать сумму, введенную пользователем (InvalidOperation при ошибке)"""
+    # Округляем до копеек: в базе суммы хранятся целым числом копеек
+    amount = Decimal(text.strip().replace(',', '.')).quantize(
+        Decimal("0.01"), rounding=ROUND_HALF_UP
+    )
+    # NaN, бесконечность и суммы, которые не поместятся в базу, считаем ошибкой ввода
+    if not amount.is_finite() or amount > MAX_AMOUNT:
+        raise InvalidOperation(f"Сумма вне допустимого диапазона: {text}")
+    return amount
+
+
+async def session_expired(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Данные диалога удалены (истек срок) - начинаем заново"""
+    context.user_data.clear()
+    await update.message.reply_text(
+        "⌛ Время ввода истекло. Начните заново.",
+        reply_markup=get_main_keyboard()
+    )
+    return ConversationHandler.END
+
+
+async def conversation_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Диалог брошен на середине: освобождаем его данные"""
+    context.user_data.clear()
+
+
 async def handle_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ввода суммы"""
     try:
-        amount = float(update.message.text.replace(',', '.'))
+        amount = parse_amount(update.message.text)
         if amount <= 0:
             await update.message.reply_text(
                 "Сумма должна быть положительным числом. Попробуйте еще раз:"
@@ -346,7 +759,7 @@ async def handle_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await update.message.reply_text(
             f"Сумма: <b>{amount:,.2f} ₽</b>\n"
-            f"Категория: <b>{category_name}</b>\n\n"
+            f"Категория: <b>{html.escape(category_name)}</b>\n\n"
             "Введите дату (ДД.ММ.ГГГГ) или отправьте 'сегодня' для сегодняшней даты:",
             parse_mode='HTML',
             reply_markup=InlineKeyboardMarkup([[
@@ -355,7 +768,7 @@ async def handle_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_DATE
     
-    except ValueError:
+    except InvalidOperation:
         await update.message.reply_text(
             "Неверный формат суммы. Введите число (например: 1000 или 1000.50):"
         )
@@ -380,12 +793,16 @@ async def handle_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         amount = context.user_data.get('amount')
         category_name = context.user_data.get('selected_category')
+        category_id = context.user_data.get('selected_category_id')
         
-        if db.add_transaction(user_id, category_name, amount, transaction_date.isoformat()):
-            total = db.get_total_by_category(user_id, category_name)
+        if amount is None or not category_id:
+            return await session_expired(update, context)
+        
+        if db.add_transaction(user_id, category_name, amount, transaction_date.isoformat(), category_id):
+            total = db.get_total_by_category(user_id, category_name, category_id)
             await update.message.reply_text(
                 f"✅ Доход добавлен!\n\n"
-                f"Категория: <b>{category_name}</b>\n"
+                f"Категория: <b>{html.escape(category_name)}</b>\n"
                 f"Сумма: <b>{amount:,.2f} ₽</b>\n"
                 f"Дата: <b>{transaction_date.strftime('%d.%m.%Y')}</b>\n\n"
                 f"Всего по категории: <b>{total:,.2f} ₽</b>",
@@ -395,6 +812,7 @@ async def handle_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             # Очищаем данные
             context.user_data.clear()
+            await send_budget_alerts(context.bot, user_id)
             return ConversationHandler.END
         else:
             await update.message.reply_text(
@@ -421,22 +839,215 @@ async def handle_category_name(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return WAITING_CATEGORY_NAME
     
+    context.user_data['picker'] = PICKER_ADD
     if db.add_category(user_id, category_name):
         await update.message.reply_text(
-            f"✅ Категория <b>{category_name}</b> добавлена!",
+            f"✅ Категория <b>{html.escape(category_name)}</b> добавлена!\n\n{get_categories_text(PICKER_ADD)}",
             parse_mode='HTML',
             reply_markup=get_categories_keyboard(user_id)
         )
         return ConversationHandler.END
     else:
         await update.message.reply_text(
-            f"❌ Категория <b>{category_name}</b> уже существует или произошла ошибка.",
+            f"❌ Категория <b>{html.escape(category_name)}</b> уже существует или произошла ошибка.\n\n"
+            f"{get_categories_text(PICKER_ADD)}",
             parse_mode='HTML',
             reply_markup=get_categories_keyboard(user_id)
         )
         return ConversationHandler.END
 
 
+async def handle_category_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск категории по началу названия, пока открыт выбор категории"""
+    purpose = context.user_data.get('picker')
+    if not purpose:
+        return
+    
+    user_id = update.effective_user.id
+    search = update.message.text.strip().upper()
+    context.user_data['picker_search'] = search
+    await update.message.reply_text(
+        get_categories_text(purpose, search),
+        parse_mode='HTML',
+        reply_markup=get_categories_keyboard(user_id, purpose, 0, search)
+    )
+
+
+async def handle_recurring_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик ввода суммы регулярного дохода"""
+    try:
+        amount = parse_amount(update.message.text)
+    except InvalidOperation:
+        amount = None
+    
+    if amount is None or amount <= 0:
+        await update.message.reply_text(
+            "Неверная сумма. Введите положительное число (например: 1000 или 1000.50):"
+        )
+        return WAITING_RECURRING_AMOUNT
+    
+    context.user_data['amount'] = amount
+    await update.message.reply_text(
+        f"Сумма: <b>{amount:,.2f} ₽</b>\n"
+        f"Категория: <b>{context.user_data.get('selected_category', '')}</b>\n\n"
+        "Как часто записывать доход?\n"
+        "• <code>месяц 10</code> - каждый месяц 10-го числа\n"
+        "• <code>неделя 1</code> - каждую неделю (1 - понедельник, 7 - воскресенье)\n"
+        "• <code>дни 14</code> - каждые 14 дней, начиная с сегодня",
+        parse_mode='HTML',
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("◀️ Отмена", callback_data="recurring")
+        ]])
+    )
+    return WAITING_RECURRING_SCHEDULE
+
+
+async def handle_recurring_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик ввода расписания регулярного дохода"""
+    user_id = update.effective_user.id
+    schedule = parse_schedule(update.message.text)
+    
+    if not schedule:
+        await update.message.reply_text(
+            "Неверный формат. Введите, например: месяц 10, неделя 1 или дни 14:"
+        )
+        return WAITING_RECURRING_SCHEDULE
+    
+    kind, value = schedule
+    category_name = context.user_data.get('selected_category')
+    amount = context.user_data.get('amount')
+    category_id = context.user_data.get('selected_category_id')
+    
+    if amount is None or not category_id:
+        return await session_expired(update, context)
+    
+    context.user_data.clear()
+    if not db.add_recurring_rule(user_id, category_id, amount, kind, value):
+        await update.message.reply_text(
+            "❌ Ошибка при добавлении правила. Попробуйте еще раз.",
+            reply_markup=get_main_keyboard()
+        )
+        return ConversationHandler.END
+    
+    # Правило могло наступить уже сегодня: запись создаст плановая задача, не задерживая ответ
+    # (materialize_recurring обрабатывает правила всех пользователей)
+    context.job_queue.run_once(recurring_job, 0, name="recurring_now")
+    
+    text, keyboard = get_recurring_text_and_keyboard(user_id)
+    await update.message.reply_text(
+        f"✅ Правило добавлено: <b>{html.escape(category_name)}</b>, {amount:,.2f} ₽, {describe_schedule(kind, value)}\n\n{text}",
+        parse_mode='HTML',
+        reply_markup=keyboard
+    )
+    return ConversationHandler.END
+
+
+async def handle_budget_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик ввода суммы цели"""
+    user_id = update.effective_user.id
+    try:
+        amount = parse_amount(update.message.text)
+    except InvalidOperation:
+        amount = None
+    
+    if amount is None or amount <= 0:
+        await update.message.reply_text(
+            "Неверная сумма. Введите положительное число (например: 100000):"
+        )
+        return WAITING_BUDGET_AMOUNT
+    
+    if 'selected_category_id' not in context.user_data:
+        return await session_expired(update, context)
+    
+    category_name = context.user_data.get('selected_category')
+    category_id = context.user_data.get('selected_category_id')
+    context.user_data.clear()
+    
+    if db.set_budget_target(user_id, category_id, amount):
+        prefix = f"✅ Цель <b>{html.escape(category_name or 'Все категории')}</b>: {amount:,.2f} ₽ в месяц\n\n"
+    else:
+        prefix = "❌ Ошибка при сохранении цели.\n\n"
+    
+    text, keyboard = get_budgets_text_and_keyboard(user_id)
+    await update.message.reply_text(prefix + text, parse_mode='HTML', reply_markup=keyboard)
+    await send_budget_alerts(context.bot, user_id)
+    return ConversationHandler.END
+
+
+async def handle_group_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик создания группы"""
+    user = update.effective_user
+    group_name = update.message.text.strip()
+    
+    if len(group_name) == 0:
+        await update.message.reply_text(
+            "Название группы не может быть пустым. Попробуйте еще раз:"
+        )
+        return WAITING_GROUP_NAME
+    
+    group_id = db.create_group(user.id, group_name, user.full_name)
+    group = db.get_group(group_id, user.id)
+    await update.message.reply_text(
+        f"✅ Группа создана!\n\n{get_group_text(group)}",
+        parse_mode='HTML',
+        reply_markup=get_group_keyboard(group_id)
+    )
+    return ConversationHandler.END
+
+
+async def handle_group_category_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик добавления категории группы"""
+    user_id = update.effective_user.id
+    group_id = context.user_data.get('group_id')
+    category_name = update.message.text.strip().upper()
+    
+    if group_id is None:
+        return await session_expired(update, context)
+    
+    if len(category_name) == 0:
+        await update.message.reply_text(
+            "Название категории не может быть пустым. Попробуйте еще раз:"
+        )
+        return WAITING_GROUP_CATEGORY_NAME
+    
+    context.user_data.clear()
+    if db.add_group_category(group_id, user_id, category_name):
+        text = f"✅ Категория группы <b>{html.escape(category_name)}</b> добавлена!"
+    else:
+        text = f"❌ Категория <b>{html.escape(category_name)}</b> уже существует или произошла ошибка."
+    
+    await update.message.reply_text(
+        text,
+        parse_mode='HTML',
+        reply_markup=get_group_keyboard(group_id)
+    )
+    return ConversationHandler.END
+
+
+async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /join КОД - вступление в группу"""
+    user = update.effective_user
+    
+    if not context.args:
+        await update.message.reply_text("Использование: /join КОД")
+        return
+    
+    group_id = db.join_group(user.id, context.args[0], user.full_name)
+    if not group_id:
+        await update.message.reply_text(
+            "❌ Группа с таким кодом не найдена.",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    group = db.get_group(group_id, user.id)
+    await update.message.reply_text(
+        f"✅ Вы в группе!\n\n{get_group_text(group)}",
+        parse_mode='HTML',
+        reply_markup=get_group_keyboard(group_id)
+    )
+
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отмена операции"""
     context.user_data.clear()
@@ -447,6 +1058,106 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+async def migrate_amounts_job(context: ContextTypes.DEFAULT_TYPE):
+    """Задача планировщика: порционный перенос сумм в копейки без остановки бота"""
+    migrated = await asyncio.to_thread(db.migrate_amounts)
+    if not migrated:
+        logger.info("Миграция сумм в копейки завершена, старая колонка будет удалена при следующем запуске")
+        context.job.schedule_removal()
+
+
+async def recurring_job(context: ContextTypes.DEFAULT_TYPE):
+    """Задача планировщика: записать доходы по наступившим регулярным правилам"""
+    created = await asyncio.to_thread(db.materialize_recurring)
+    if created:
+        logger.info(f"Регулярные доходы: создано записей: {created}")
+        await send_budget_alerts(context.bot)
+
+
+def is_admin(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+    """Проверить, является ли пользователь администратором бота"""
+    return user_id in context.bot_data.get('admin_ids', ())
+
+
+async def run_backup() -> str:
+    """Создать резервную копию в отдельном потоке, не блокируя обработчики"""
+    return await asyncio.to_thread(backup_manager.create_backup)
+
+
+async def scheduled_backup(context: ContextTypes.DEFAULT_TYPE):
+    """Задача планировщика: регулярное резервное копирование"""
+    try:
+        await run_backup()
+    except Exception as e:
+        logger.error(f"Ошибка резервного копирования: {e}", exc_info=True)
+
+
+async def health_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /health - показатели памяти (только для администраторов)"""
+    if not is_admin(context, update.effective_user.id):
+        return
+    
+    gauges = state_manager.gauges(context.application)
+    await update.message.reply_text(
+        "🩺 Состояние бота\n\n"
+        f"Пользователей в памяти: {gauges['users']} (user_data: {gauges['user_data']})\n"
+        f"Чатов в памяти: {gauges['chats']} (chat_data: {gauges['chat_data']})\n"
+        f"Незавершенных диалогов: {gauges['conversations']}\n"
+        f"Память (RSS): {gauges['rss_kb'] / 1024:.1f} МБ"
+    )
+
+
+async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /backup (только для администраторов)"""
+    if not is_admin(context, update.effective_user.id):
+        return
+
+    await update.message.reply_text("📦 Создание резервной копии...")
+    try:
+        path = await run_backup()
+    except Exception as e:
+        logger.error(f"Ошибка резервного копирования: {e}", exc_info=True)
+        await update.message.reply_text(f"❌ Ошибка резервного копирования: {e}")
+        return
+
+    await update.message.reply_text(f"✅ Резервная копия создана: {path}")
+
+
+def prepare_monthly_digest(today: date, only_missing: bool = False):
+    """Поставить в очередь итоги прошлого месяца (only_missing - если еще не ставились)"""
+    start_date, end_date = previous_month_period(today)
+    digest_key = f"month_{start_date.year}_{start_date.month:02d}"
+    if only_missing and db.has_digest(digest_key):
+        return
+    title = f"Итоги за {MONTH_NAMES[start_date.month]} {start_date.year}"
+    prepare_digest(db, digest_key, title, start_date, end_date)
+
+
+async def monthly_digest_job(context: ContextTypes.DEFAULT_TYPE):
+    """Задача планировщика: итоги прошлого месяца всем пользователям"""
+    await asyncio.to_thread(prepare_monthly_digest, date.today())
+    await deliver_pending_digests(context.bot, db)
+
+
+async def weekly_digest_job(context: ContextTypes.DEFAULT_TYPE):
+    """Задача планировщика: итоги прошлой недели всем пользователям"""
+    start_date, end_date = previous_week_period(date.today())
+    last_day = end_date - timedelta(days=1)
+    title = f"Итоги за неделю {start_date.strftime('%d.%m')} - {last_day.strftime('%d.%m.%Y')}"
+    digest_key = f"week_{start_date.isoformat()}"
+    await asyncio.to_thread(prepare_digest, db, digest_key, title, start_date, end_date)
+    await deliver_pending_digests(context.bot, db)
+
+
+async def resume_digest_job(context: ContextTypes.DEFAULT_TYPE):
+    """Задача планировщика: дослать дайджесты, прерванные или пропущенные из-за остановки бота"""
+    now = datetime.now()
+    # Бот не работал 1-го числа в 10:00: месячная рассылка не запускалась
+    if now.day <= DIGEST_CATCHUP_DAYS and (now.day > 1 or now.time() >= MONTHLY_DIGEST_TIME):
+        await asyncio.to_thread(prepare_monthly_digest, now.date(), True)
+    await deliver_pending_digests(context.bot, db)
+
+
 def clear_webhook_sync(bot_token: str):
     """Очистить webhook перед запуском polling (синхронный метод)"""
     import requests
@@ -484,61 +1195,128 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Ошибка при обработке обновления: {error}", exc_info=error)
 
 
-def main():
-    """Главная функция запуска бота"""
-    from config import BOT_TOKEN
-    
-    if BOT_TOKEN == "YOUR_BOT_TOKEN":
-        print("⚠️  ВНИМАНИЕ: Замените YOUR_BOT_TOKEN в config.py на ваш токен бота!")
-        return
-    
-    # Очищаем webhook перед запуском (синхронно)
-    clear_webhook_sync(BOT_TOKEN)
-    
+def build_application(bot_token: str, admin_ids=(), request=None, schedule_jobs: bool = True,
+                      trace_recorder=None) -> Application:
+    """Создать приложение: обработчики и задачи планировщика"""
     # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = Application.builder().token(bot_token)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
+    application.bot_data['admin_ids'] = set(admin_ids)
     
-    # ConversationHandler для добавления дохода
-    add_income_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(button_handler, pattern="^category_")],
+    # Все диалоги (доход, категория, группы, регулярные доходы, цели) - в одном
+    # ConversationHandler: у пользователя активен не больше одного диалога, и любая
+    # кнопка или /start переключает его. button_handler возвращает состояние нового
+    # диалога или END, поэтому брошенный на середине ввод не перехватывает текст,
+    # предназначенный для другого экрана.
+    text_input = filters.TEXT & ~filters.COMMAND
+    conversation_handler = ConversationHandler(
+        entry_points=[CallbackQueryHandler(button_handler), CommandHandler("start", start)],
         states={
-            WAITING_AMOUNT: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_amount),
-                CallbackQueryHandler(button_handler, pattern="^(add|back_to_main)$")
-            ],
-            WAITING_DATE: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_date),
-                CallbackQueryHandler(button_handler, pattern="^(add|back_to_main)$")
-            ],
+            WAITING_AMOUNT: [MessageHandler(text_input, handle_amount)],
+            WAITING_DATE: [MessageHandler(text_input, handle_date)],
+            WAITING_CATEGORY_NAME: [MessageHandler(text_input, handle_category_name)],
+            WAITING_GROUP_NAME: [MessageHandler(text_input, handle_group_name)],
+            WAITING_GROUP_CATEGORY_NAME: [MessageHandler(text_input, handle_group_category_name)],
+            WAITING_RECURRING_AMOUNT: [MessageHandler(text_input, handle_recurring_amount)],
+            WAITING_RECURRING_SCHEDULE: [MessageHandler(text_input, handle_recurring_schedule)],
+            WAITING_BUDGET_AMOUNT: [MessageHandler(text_input, handle_budget_amount)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)],
         },
-        fallbacks=[CommandHandler("cancel", cancel)],
-        per_chat=True,
-        per_user=True,
-    )
-    
-    # ConversationHandler для добавления категории
-    add_category_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(button_handler, pattern="^add_category$")],
-        states={
-            WAITING_CATEGORY_NAME: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_category_name),
-                CallbackQueryHandler(button_handler, pattern="^(add|back_to_main)$")
-            ],
-        },
-        fallbacks=[CallbackQueryHandler(button_handler, pattern="^(add|back_to_main)$")],
+        fallbacks=[
+            CallbackQueryHandler(button_handler),
+            CommandHandler("start", start),
+            CommandHandler("cancel", cancel),
+        ],
         per_chat=True,
         per_user=True,
+        conversation_timeout=CONVERSATION_TIMEOUT,
     )
     
     # Добавляем обработчики
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(add_income_handler)
-    application.add_handler(add_category_handler)
-    application.add_handler(CallbackQueryHandler(button_handler))
+    # Запись трассировки обновлений (самой первой группой, до любых обработчиков)
+    if trace_recorder is not None:
+        application.add_handler(TypeHandler(Update, trace_recorder.record), group=-2)
+    # Отмечаем активность до остальных обработчиков (группа -1)
+    application.add_handler(TypeHandler(Update, state_manager.touch), group=-1)
+    application.add_handler(CommandHandler("health", health_command))
+    application.add_handler(CommandHandler("backup", backup_command))
+    application.add_handler(CommandHandler("join", join_command))
+    application.add_handler(conversation_handler)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_category_search))
     
     # Добавляем обработчик ошибок
     application.add_error_handler(error_handler)
     
+    if not schedule_jobs:
+        return application
+    
+    # Регулярное резервное копирование базы данных
+    application.job_queue.run_repeating(
+        scheduled_backup,
+        interval=BACKUP_INTERVAL,
+        first=60,
+        name="backup"
+    )
+    
+    # Перенос сумм старых записей в копейки (для баз, созданных до перехода)
+    if not db.amounts_migrated:
+        application.job_queue.run_repeating(migrate_amounts_job, interval=1, first=5, name="migrate_amounts")
+    
+    # Очистка данных неактивных пользователей
+    application.job_queue.run_repeating(
+        state_manager.sweep_job,
+        interval=STATE_SWEEP_INTERVAL,
+        first=STATE_SWEEP_INTERVAL,
+        name="state_sweep"
+    )
+    
+    # Регулярные доходы: при запуске (догоняем пропущенное) и затем каждый час
+    application.job_queue.run_repeating(recurring_job, interval=RECURRING_CHECK_INTERVAL, first=10, name="recurring")
+    
+    # Рассылка дайджестов: 1-го числа за прошлый месяц, по понедельникам за неделю
+    application.job_queue.run_monthly(monthly_digest_job, when=MONTHLY_DIGEST_TIME, day=1, name="monthly_digest")
+    if DIGEST_WEEKLY:
+        application.job_queue.run_daily(weekly_digest_job, time=time(10, 0), days=(1,), name="weekly_digest")
+    application.job_queue.run_repeating(resume_digest_job, interval=3600, first=30, name="resume_digest")
+    
+    return application
+
+
+def main():
+    """Главная функция запуска бота"""
+    import config
+    BOT_TOKEN = config.BOT_TOKEN
+    
+    if BOT_TOKEN == "YOUR_BOT_TOKEN":
+        print("⚠️  ВНИМАНИЕ: Замените YOUR_BOT_TOKEN в config.py на ваш токен бота!")
+        return
+    
+    # Очищаем webhook перед запуском (синхронно)
+    clear_webhook_sync(BOT_TOKEN)
+    
+    # Запись трассировки обновлений (включается в config.py, см. tracing.py)
+    trace_recorder = None
+    trace_file = getattr(config, "TRACE_FILE", None)
+    trace_salt = getattr(config, "TRACE_SALT", None)
+    if trace_file and not trace_salt:
+        logger.error("TRACE_FILE задан без TRACE_SALT: запись трассировки выключена "
+                     "(без соли трассировку нельзя воспроизвести на копии базы)")
+    elif trace_file:
+        trace_recorder = TraceRecorder(
+            trace_file,
+            salt=trace_salt,
+            amount_jitter=getattr(config, "TRACE_AMOUNT_JITTER", 0.0)
+        )
+        logger.info(f"Запись трассировки обновлений в {trace_file}")
+    
+    application = build_application(
+        BOT_TOKEN,
+        admin_ids=getattr(config, "ADMIN_IDS", []),
+        trace_recorder=trace_recorder
+    )
+    
     # Запускаем бота
     logger.info("Бот запущен...")
     try:
@@ -1,17 +1,69 @@
+import secrets
 import sqlite3
-from datetime import datetime
-from typing import List, Tuple, Optional
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Tuple, Optional, Union
+
+from recurring import first_run_date, next_run_date
+
+# Максимальная сумма одной записи (в рублях). С запасом меньше предела INTEGER SQLite
+# в копейках, чтобы не переполнялись и месячные суммы.
+MAX_AMOUNT = Decimal("1000000000")
+
+# Сколько строк переносить за один шаг миграции сумм в копейки
+AMOUNT_MIGRATION_BATCH = 1000
+
+# Сколько категорий показывать на одной странице выбора
+CATEGORY_PAGE_SIZE = 10
+
+# Сколько последних транзакций просматривать для списка недавних категорий
+RECENT_CATEGORIES_SCAN = 200
+
+# Пороги уведомлений о цели (в процентах)
+BUDGET_THRESHOLDS = (50, 100)
+
+# Категории, доступные пользователю: общие, личные и категории его групп.
+# Параметры: user_id, user_id
+VISIBLE_CATEGORIES_SQL = """(
+    user_id = ? OR user_id = 0
+    OR group_id IN (SELECT group_id FROM group_members WHERE user_id = ?)
+)"""
+
+
+def to_kopecks(amount: Union[Decimal, float, int, str]) -> int:
+    """Перевести сумму в рублях в целое число копеек"""
+    if isinstance(amount, float):
+        # repr дает кратчайшее десятичное представление (0.285 -> '0.285')
+        amount = repr(amount)
+    return int(Decimal(amount).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+
+
+def from_kopecks(kopecks: Optional[int]) -> Decimal:
+    """Перевести целое число копеек в точную сумму в рублях"""
+    return Decimal(kopecks or 0).scaleb(-2)
+
+
+def _sql_to_kopecks(amount: Optional[float]) -> Optional[int]:
+    """to_kopecks для SQL-запросов (NULL остается NULL)"""
+    return None if amount is None else to_kopecks(amount)
 
 
 class Database:
     def __init__(self, db_name: str = "income_bot.db"):
         self.db_name = db_name
+        # До проверки схемы считаем, что старые суммы могут быть
+        self._legacy_amount = True
+        self._amounts_migrated = False
+        self._monthly_totals_stale = False
         self.init_database()
 
     def get_connection(self):
         """Получить соединение с базой данных"""
         conn = sqlite3.connect(self.db_name)
         conn.row_factory = sqlite3.Row
+        # Суммы еще не перенесенных строк считаются в запросах через to_kopecks.
+        # Регистрируем всегда: запрос мог быть собран до завершения миграции.
+        conn.create_function("to_kopecks", 1, _sql_to_kopecks, deterministic=True)
         return conn
 
     def init_database(self):
@@ -20,28 +72,177 @@ class Database:
         cursor = conn.cursor()
 
         # Таблица категорий
+        self._create_categories_table(cursor, "categories")
+
+        cursor.execute("PRAGMA table_info(categories)")
+        if "group_id" not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE categories ADD COLUMN group_id INTEGER")
+
+        # В старых базах название категории уникально среди всех пользователей (name UNIQUE):
+        # перестраиваем таблицу, уникальность теперь в пределах владельца (индексы ниже)
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS categories (
+            SELECT 1 FROM sqlite_master
+            WHERE type = 'index' AND tbl_name = 'categories' AND name LIKE 'sqlite_autoindex_%'
+        """)
+        if cursor.fetchone():
+            self._rebuild_table(cursor, "categories", self._create_categories_table,
+                                "id, name, user_id, group_id, created_at")
+
+        # Группы (общий учет для нескольких аккаунтов) и их участники
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ledger_groups (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                owner_id INTEGER NOT NULL,
+                invite_code TEXT NOT NULL UNIQUE,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
 
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS group_members (
+                group_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                display_name TEXT NOT NULL DEFAULT '',
+                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (group_id, user_id),
+                FOREIGN KEY (group_id) REFERENCES ledger_groups(id)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_group_members_user
+            ON group_members(user_id, group_id)
+        """)
+
+        # Выбор категорий: постраничный вывод и поиск по началу названия
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_categories_user_name
+            ON categories(user_id, name)
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_categories_group
+            ON categories(group_id) WHERE group_id IS NOT NULL
+        """)
+
+        # Название уникально среди личных категорий владельца (user_id = 0 - общие)
+        # и среди категорий одной группы
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_owner_name
+            ON categories(user_id, name) WHERE group_id IS NULL
+        """)
+
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_group_name
+            ON categories(group_id, name) WHERE group_id IS NOT NULL
+        """)
+
         # Таблица транзакций
+        self._create_transactions_table(cursor, "transactions")
+
+        self._prepare_amount_migration(cursor)
+
+        # Суммы по пользователю, месяцу и категории. Обновляются при каждой записи,
+        # поэтому статистика групп не пересчитывает транзакции участников.
+        cursor.execute("""
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'monthly_totals'
+        """)
+        monthly_totals_exist = cursor.fetchone() is not None
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS monthly_totals (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
+                total_kopecks INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month, category_id)
+            )
+        """)
+
+        if not monthly_totals_exist or self._monthly_totals_stale:
+            self._rebuild_monthly_totals(cursor)
+
+        self._create_transaction_indexes(cursor)
+
+        # Регулярные доходы (зарплата, постоянные контракты)
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
+            CREATE TABLE IF NOT EXISTS recurring_rules (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 category_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                transaction_date DATE NOT NULL,
+                amount_kopecks INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                value INTEGER NOT NULL,
+                next_run DATE NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (category_id) REFERENCES categories(id)
             )
         """)
 
+        # Планировщик выбирает только наступившие правила по этому индексу
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_recurring_rules_next_run
+            ON recurring_rules(next_run)
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_recurring_rules_user
+            ON recurring_rules(user_id)
+        """)
+
+        # Месячные цели по категории (category_id = 0 - по всем категориям)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS budget_targets (
+                user_id INTEGER NOT NULL,
+                category_id INTEGER NOT NULL,
+                target_kopecks INTEGER NOT NULL,
+                PRIMARY KEY (user_id, category_id)
+            )
+        """)
+
+        # Сработавшие пороги: не более одного уведомления на порог за месяц
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS budget_alerts (
+                user_id INTEGER NOT NULL,
+                category_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                threshold INTEGER NOT NULL,
+                notified INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, category_id, month, threshold)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_budget_alerts_pending
+            ON budget_alerts(user_id) WHERE notified = 0
+        """)
+
+        # Пользователи с целями и с неотправленными уведомлениями. Держим в памяти,
+        # чтобы запись транзакции без целей не делала лишних запросов.
+        cursor.execute("SELECT DISTINCT user_id FROM budget_targets")
+        self._budget_users = {row[0] for row in cursor.fetchall()}
+        cursor.execute("SELECT DISTINCT user_id FROM budget_alerts WHERE notified = 0")
+        self._alert_users = {row[0] for row in cursor.fetchall()}
+
+        # Очередь рассылки дайджестов (позволяет продолжить рассылку после перезапуска)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS digest_queue (
+                digest_key TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (digest_key, user_id)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_digest_queue_pending
+            ON digest_queue(digest_key, user_id) WHERE status = 'pending'
+        """)
+
         # Создаем начальные категории для всех пользователей
         default_categories = ["ПТТ", "ПРИОРИТЕТ", "СТАНКИ", "СКИПЕТР"]
         for category_name in default_categories:
@@ -53,6 +254,223 @@ class Database:
         conn.commit()
         conn.close()
 
+    def _create_categories_table(self, cursor, table: str):
+        """Создать таблицу категорий (под другим именем - при перестройке)"""
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                group_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+    def _rebuild_table(self, cursor, table: str, create_table, columns: str):
+        """Перестроить таблицу по новой схеме (create_table) с переносом колонок columns.
+
+        Таблица копируется целиком (как требует SQLite для смены схемы) в текущей
+        транзакции, счетчик AUTOINCREMENT сохраняется, индексы нужно создать заново.
+        Вызывается только из init_database: копирование блокирует запись.
+        """
+        if not cursor.connection.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+        sequence = cursor.fetchone()
+
+        cursor.execute(f"DROP TABLE IF EXISTS {table}_rebuild")
+        create_table(cursor, f"{table}_rebuild")
+        cursor.execute(f"INSERT INTO {table}_rebuild ({columns}) SELECT {columns} FROM {table}")
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+        if sequence:
+            cursor.execute("""
+                UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?
+            """, (sequence[0], table))
+
+    def _create_transactions_table(self, cursor, table: str):
+        """Создать таблицу транзакций (под другим именем - при перестройке)"""
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                category_id INTEGER NOT NULL,
+                amount_kopecks INTEGER NOT NULL,
+                transaction_date DATE NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (category_id) REFERENCES categories(id)
+            )
+        """)
+
+    def _create_transaction_indexes(self, cursor):
+        """Создать индексы таблицы транзакций"""
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_transactions_date
+            ON transactions(transaction_date)
+        """)
+
+        # Индекс по пользователю (rowid в нем неявно): последние транзакции без полного просмотра
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_transactions_user
+            ON transactions(user_id)
+        """)
+
+    def _prepare_amount_migration(self, cursor):
+        """Подготовить перенос сумм из REAL в целые копейки для старых баз"""
+        cursor.execute("PRAGMA table_info(transactions)")
+        columns = {row[1] for row in cursor.fetchall()}
+
+        # В старых базах сумма хранится в колонке amount REAL
+        self._legacy_amount = "amount" in columns
+        self._amounts_migrated = True
+        if not self._legacy_amount:
+            return
+
+        if "amount_kopecks" not in columns:
+            cursor.execute("ALTER TABLE transactions ADD COLUMN amount_kopecks INTEGER")
+
+        # Частичный индекс по еще не перенесенным строкам: после миграции он пуст
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_transactions_unmigrated
+            ON transactions(id) WHERE amount_kopecks IS NULL
+        """)
+        cursor.execute("SELECT 1 FROM transactions WHERE amount_kopecks IS NULL LIMIT 1")
+        self._amounts_migrated = cursor.fetchone() is None
+        if self._amounts_migrated:
+            # Перенос завершился при прошлом запуске: удаляем старую колонку сейчас,
+            # пока обработчики не работают, и пересчитываем месячные суммы
+            # (в базах, где их считали по REAL до to_kopecks)
+            self._drop_legacy_amount(cursor)
+            self._monthly_totals_stale = True
+
+    def _drop_legacy_amount(self, cursor):
+        """Перестроить таблицу транзакций без старой колонки amount REAL"""
+        self._rebuild_table(cursor, "transactions", self._create_transactions_table,
+                            "id, user_id, category_id, amount_kopecks, transaction_date, created_at")
+        self._create_transaction_indexes(cursor)
+        self._legacy_amount = False
+
+    def _rebuild_monthly_totals(self, cursor):
+        """Пересчитать таблицу monthly_totals по всем транзакциям"""
+        cursor.execute("DELETE FROM monthly_totals")
+        cursor.execute(f"""
+            INSERT INTO monthly_totals (user_id, month, category_id, total_kopecks)
+            SELECT user_id, substr(transaction_date, 1, 7), category_id, SUM({self._amount_sql()})
+            FROM transactions
+            GROUP BY user_id, substr(transaction_date, 1, 7), category_id
+        """)
+
+    def _add_to_monthly_totals(self, cursor, entries: Iterable[Tuple[int, int, int, str]]):
+        """Изменить месячные суммы. entries: (user_id, category_id, копейки, дата)"""
+        cursor.executemany("""
+            INSERT INTO monthly_totals (user_id, category_id, total_kopecks, month)
+            VALUES (?, ?, ?, substr(?, 1, 7))
+            ON CONFLICT (user_id, month, category_id)
+            DO UPDATE SET total_kopecks = total_kopecks + excluded.total_kopecks
+        """, entries)
+
+    def _update_budget_alerts(self, cursor, entries: Iterable[Tuple[int, int, int, str]]):
+        """Проверить цели после изменения сумм. entries: (user_id, category_id, копейки, дата)
+
+        Работает по уже обновленным monthly_totals и только для пользователей с целями.
+        """
+        affected = {}
+        for user_id, category_id, _, transaction_date in entries:
+            if user_id in self._budget_users:
+                affected.setdefault((user_id, transaction_date[:7]), set()).add(category_id)
+
+        for (user_id, month), category_ids in affected.items():
+            cursor.execute("""
+                SELECT category_id, target_kopecks FROM budget_targets WHERE user_id = ?
+            """, (user_id,))
+            targets = dict(cursor.fetchall())
+
+            cursor.execute("""
+                SELECT category_id, total_kopecks FROM monthly_totals
+                WHERE user_id = ? AND month = ?
+            """, (user_id, month))
+            totals = dict(cursor.fetchall())
+
+            for category_id in (category_ids | {0}) & targets.keys():
+                total = sum(totals.values()) if category_id == 0 else totals.get(category_id, 0)
+                for threshold in BUDGET_THRESHOLDS:
+                    key = (user_id, category_id, month, threshold)
+                    if total * 100 >= targets[category_id] * threshold:
+                        cursor.execute("""
+                            INSERT OR IGNORE INTO budget_alerts (user_id, category_id, month, threshold)
+                            VALUES (?, ?, ?, ?)
+                        """, key)
+                        if cursor.rowcount:
+                            self._alert_users.add(user_id)
+                    else:
+                        # Порог больше не достигнут (например, запись удалили) - не уведомляем
+                        cursor.execute("""
+                            DELETE FROM budget_alerts
+                            WHERE user_id = ? AND category_id = ? AND month = ? AND threshold = ?
+                            AND notified = 0
+                        """, key)
+
+    def _insert_transactions(self, cursor, rows: List[Tuple[int, int, int, str]]):
+        """Вставить транзакции и обновить месячные суммы. rows: (user_id, category_id, копейки, дата)"""
+        if self._legacy_amount:
+            # Старая колонка amount NOT NULL остается до следующего запуска: заполняем ее
+            cursor.executemany("""
+                INSERT INTO transactions (user_id, category_id, amount, amount_kopecks, transaction_date)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(user_id, category_id, kopecks / 100, kopecks, transaction_date)
+                  for user_id, category_id, kopecks, transaction_date in rows])
+        else:
+            cursor.executemany("""
+                INSERT INTO transactions (user_id, category_id, amount_kopecks, transaction_date)
+                VALUES (?, ?, ?, ?)
+            """, rows)
+        self._add_to_monthly_totals(cursor, rows)
+        self._update_budget_alerts(cursor, rows)
+
+    @property
+    def amounts_migrated(self) -> bool:
+        """Все ли суммы перенесены в копейки"""
+        return self._amounts_migrated
+
+    def _amount_sql(self, prefix: str = "") -> str:
+        """SQL-выражение суммы в копейках (учитывает строки, еще не перенесенные миграцией)"""
+        if self._amounts_migrated:
+            return f"{prefix}amount_kopecks"
+        # Та же функция to_kopecks, что и при переносе: итоги не меняются по ходу миграции
+        return f"COALESCE({prefix}amount_kopecks, to_kopecks({prefix}amount))"
+
+    def migrate_amounts(self, batch_size: int = AMOUNT_MIGRATION_BATCH) -> int:
+        """Перенести очередную порцию сумм в копейки. Возвращает число перенесенных строк"""
+        if self._amounts_migrated:
+            return 0
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT id, amount FROM transactions
+                WHERE amount_kopecks IS NULL
+                ORDER BY id
+                LIMIT ?
+            """, (batch_size,))
+            rows = cursor.fetchall()
+
+            if not rows:
+                # Все суммы перенесены. Старая колонка удаляется при следующем запуске
+                # (init_database): перестройка таблицы на ходу заблокировала бы запись.
+                self._amounts_migrated = True
+                return 0
+
+            cursor.executemany("""
+                UPDATE transactions SET amount_kopecks = ?
+                WHERE id = ?
+            """, [(to_kopecks(row[1]), row[0]) for row in rows])
+            conn.commit()
+            return len(rows)
+        finally:
+            conn.close()
+
     def add_category(self, user_id: int, category_name: str) -> bool:
         """Добавить новую категорию"""
         conn = self.get_connection()
@@ -61,10 +479,10 @@ class Database:
         category_name = category_name.upper()
         
         # Проверяем, существует ли уже такая категория (общая или пользовательская)
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT id FROM categories 
-            WHERE name = ? AND (user_id = ? OR user_id = 0)
-        """, (category_name, user_id))
+            WHERE name = ? AND {VISIBLE_CATEGORIES_SQL}
+        """, (category_name, user_id, user_id))
         
         if cursor.fetchone():
             conn.close()
@@ -87,12 +505,12 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        # Получаем категории пользователя и общие категории (user_id=0)
-        cursor.execute("""
+        # Получаем категории пользователя, общие категории (user_id=0) и категории групп
+        cursor.execute(f"""
             SELECT DISTINCT name FROM categories 
-            WHERE user_id = ? OR user_id = 0
+            WHERE {VISIBLE_CATEGORIES_SQL}
             ORDER BY name
-        """, (user_id,))
+        """, (user_id, user_id))
         
         categories = [row[0] for row in cursor.fetchall()]
         conn.close()
@@ -103,31 +521,95 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT id FROM categories 
-            WHERE name = ? AND (user_id = ? OR user_id = 0)
+            WHERE name = ? AND {VISIBLE_CATEGORIES_SQL}
             LIMIT 1
-        """, (category_name.upper(), user_id))
+        """, (category_name.upper(), user_id, user_id))
         
         row = cursor.fetchone()
         conn.close()
         return row[0] if row else None
 
-    def add_transaction(self, user_id: int, category_name: str, amount: float, transaction_date: str) -> bool:
-        """Добавить транзакцию"""
+    def get_category(self, user_id: int, category_id: int) -> Optional[str]:
+        """Получить название категории по ID (если она доступна пользователю)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(f"""
+            SELECT name FROM categories
+            WHERE id = ? AND {VISIBLE_CATEGORIES_SQL}
+        """, (category_id, user_id, user_id))
+
+        row = cursor.fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def get_categories_page(self, user_id: int, page: int = 0, prefix: Optional[str] = None,
+                            page_size: int = CATEGORY_PAGE_SIZE) -> Tuple[List[Tuple[int, str]], bool]:
+        """Получить страницу категорий (ID, название), отфильтрованных по началу названия.
+        Возвращает список и признак наличия следующей страницы"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # Поиск по началу названия - диапазон по индексу (user_id, name)
+        low = (prefix or "").upper()
+        high = low + chr(0x10FFFF)
+
+        cursor.execute(f"""
+            SELECT id, name FROM categories
+            WHERE {VISIBLE_CATEGORIES_SQL}
+            AND name >= ? AND name < ?
+            ORDER BY name
+            LIMIT ? OFFSET ?
+        """, (user_id, user_id, low, high, page_size + 1, page * page_size))
+
+        rows = [(row[0], row[1]) for row in cursor.fetchall()]
+        conn.close()
+        return rows[:page_size], len(rows) > page_size
+
+    def get_recent_categories(self, user_id: int, limit: int = 4) -> List[Tuple[int, str]]:
+        """Получить недавно использованные категории (ID, название), последние - первыми"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(f"""
+            SELECT c.id, c.name
+            FROM (
+                SELECT category_id, MAX(id) as last_id
+                FROM (
+                    SELECT category_id, id FROM transactions
+                    WHERE user_id = ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                )
+                GROUP BY category_id
+            ) r
+            JOIN categories c ON c.id = r.category_id
+            WHERE {VISIBLE_CATEGORIES_SQL}
+            ORDER BY r.last_id DESC
+            LIMIT ?
+        """, (user_id, RECENT_CATEGORIES_SCAN, user_id, user_id, limit))
+
+        results = [(row[0], row[1]) for row in cursor.fetchall()]
+        conn.close()
+        return results
+
+    def add_transaction(self, user_id: int, category_name: str, amount: Decimal, transaction_date: str,
+                        category_id: Optional[int] = None) -> bool:
+        """Добавить транзакцию (если category_id известен, поиск по имени не нужен)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        category_id = self.get_category_id(user_id, category_name)
+        category_id = category_id or self.get_category_id(user_id, category_name)
         if not category_id:
             conn.close()
             return False
 
+        kopecks = to_kopecks(amount)
+
         try:
-            cursor.execute("""
-                INSERT INTO transactions (user_id, category_id, amount, transaction_date)
-                VALUES (?, ?, ?, ?)
-            """, (user_id, category_id, amount, transaction_date))
+            self._insert_transactions(cursor, [(user_id, category_id, kopecks, transaction_date)])
             conn.commit()
             return True
         except Exception as e:
@@ -136,89 +618,93 @@ class Database:
         finally:
             conn.close()
 
-    def get_total_by_category(self, user_id: int, category_name: str) -> float:
+    def get_total_by_category(self, user_id: int, category_name: str, category_id: Optional[int] = None) -> Decimal:
         """Получить общую сумму по категории"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        amount = self._amount_sql()
         
-        category_id = self.get_category_id(user_id, category_name)
+        category_id = category_id or self.get_category_id(user_id, category_name)
         if not category_id:
             conn.close()
-            return 0.0
+            return Decimal(0)
 
-        cursor.execute("""
-            SELECT COALESCE(SUM(amount), 0) as total
+        cursor.execute(f"""
+            SELECT COALESCE(SUM({amount}), 0) as total
             FROM transactions
             WHERE user_id = ? AND category_id = ?
         """, (user_id, category_id))
         
         result = cursor.fetchone()
         conn.close()
-        return result[0] if result else 0.0
+        return from_kopecks(result[0] if result else 0)
 
-    def get_monthly_statistics(self, user_id: int, year: int, month: int) -> List[Tuple[str, float]]:
+    def get_monthly_statistics(self, user_id: int, year: int, month: int) -> List[Tuple[str, Decimal]]:
         """Получить статистику за месяц"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        amount = self._amount_sql("t.")
         
-        cursor.execute("""
-            SELECT c.name, COALESCE(SUM(t.amount), 0) as total
-            FROM categories c
-            LEFT JOIN transactions t ON c.id = t.category_id 
-                AND t.user_id = ? 
+        cursor.execute(f"""
+            SELECT c.name, SUM({amount}) as total
+            FROM transactions t
+            JOIN categories c ON c.id = t.category_id
+            WHERE t.user_id = ? 
                 AND strftime('%Y', t.transaction_date) = ? 
                 AND strftime('%m', t.transaction_date) = ?
-            WHERE c.user_id = ? OR c.user_id = 0
             GROUP BY c.id, c.name
             HAVING total > 0
             ORDER BY total DESC
-        """, (user_id, str(year), f"{month:02d}", user_id))
+        """, (user_id, str(year), f"{month:02d}"))
         
-        results = [(row[0], row[1]) for row in cursor.fetchall()]
+        results = [(row[0], from_kopecks(row[1])) for row in cursor.fetchall()]
         conn.close()
         return results
 
-    def get_all_statistics(self, user_id: int) -> List[Tuple[str, float]]:
+    def get_all_statistics(self, user_id: int) -> List[Tuple[str, Decimal]]:
         """Получить общую статистику"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        amount = self._amount_sql("t.")
         
-        cursor.execute("""
-            SELECT c.name, COALESCE(SUM(t.amount), 0) as total
-            FROM categories c
-            LEFT JOIN transactions t ON c.id = t.category_id AND t.user_id = ?
-            WHERE c.user_id = ? OR c.user_id = 0
+        cursor.execute(f"""
+            SELECT c.name, SUM({amount}) as total
+            FROM transactions t
+            JOIN categories c ON c.id = t.category_id
+            WHERE t.user_id = ?
             GROUP BY c.id, c.name
             HAVING total > 0
             ORDER BY total DESC
-        """, (user_id, user_id))
+        """, (user_id,))
         
-        results = [(row[0], row[1]) for row in cursor.fetchall()]
+        results = [(row[0], from_kopecks(row[1])) for row in cursor.fetchall()]
         conn.close()
         return results
 
-    def get_total_amount(self, user_id: int) -> float:
+    def get_total_amount(self, user_id: int) -> Decimal:
         """Получить общую сумму всех доходов"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        amount = self._amount_sql()
         
-        cursor.execute("""
-            SELECT COALESCE(SUM(amount), 0) as total
+        cursor.execute(f"""
+            SELECT COALESCE(SUM({amount}), 0) as total
             FROM transactions
             WHERE user_id = ?
         """, (user_id,))
         
         result = cursor.fetchone()
         conn.close()
-        return result[0] if result else 0.0
+        return from_kopecks(result[0] if result else 0)
 
-    def get_month_total(self, user_id: int, year: int, month: int) -> float:
+    def get_month_total(self, user_id: int, year: int, month: int) -> Decimal:
         """Получить общую сумму за месяц"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        amount = self._amount_sql()
         
-        cursor.execute("""
-            SELECT COALESCE(SUM(amount), 0) as total
+        cursor.execute(f"""
+            SELECT COALESCE(SUM({amount}), 0) as total
             FROM transactions
             WHERE user_id = ? 
             AND strftime('%Y', transaction_date) = ?
@@ -227,15 +713,16 @@ class Database:
         
         result = cursor.fetchone()
         conn.close()
-        return result[0] if result else 0.0
+        return from_kopecks(result[0] if result else 0)
 
-    def get_recent_transactions(self, user_id: int, limit: int = 10) -> List[Tuple[int, str, float, str]]:
+    def get_recent_transactions(self, user_id: int, limit: int = 10) -> List[Tuple[int, str, Decimal, str]]:
         """Получить последние транзакции пользователя"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        amount = self._amount_sql("t.")
         
-        cursor.execute("""
-            SELECT t.id, c.name, t.amount, t.transaction_date
+        cursor.execute(f"""
+            SELECT t.id, c.name, {amount}, t.transaction_date
             FROM transactions t
             JOIN categories c ON t.category_id = c.id
             WHERE t.user_id = ?
@@ -243,17 +730,18 @@ class Database:
             LIMIT ?
         """, (user_id, limit))
         
-        results = [(row[0], row[1], row[2], row[3]) for row in cursor.fetchall()]
+        results = [(row[0], row[1], from_kopecks(row[2]), row[3]) for row in cursor.fetchall()]
         conn.close()
         return results
 
-    def get_transaction(self, transaction_id: int, user_id: int) -> Optional[Tuple[int, str, float, str]]:
+    def get_transaction(self, transaction_id: int, user_id: int) -> Optional[Tuple[int, str, Decimal, str]]:
         """Получить транзакцию по ID"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        amount = self._amount_sql("t.")
         
-        cursor.execute("""
-            SELECT t.id, c.name, t.amount, t.transaction_date
+        cursor.execute(f"""
+            SELECT t.id, c.name, {amount}, t.transaction_date
             FROM transactions t
             JOIN categories c ON t.category_id = c.id
             WHERE t.id = ? AND t.user_id = ?
@@ -261,21 +749,23 @@ class Database:
         
         row = cursor.fetchone()
         conn.close()
-        return (row[0], row[1], row[2], row[3]) if row else None
+        return (row[0], row[1], from_kopecks(row[2]), row[3]) if row else None
 
     def delete_transaction(self, transaction_id: int, user_id: int) -> bool:
         """Удалить транзакцию"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        amount = self._amount_sql()
         
         try:
             # Проверяем, что транзакция принадлежит пользователю
-            cursor.execute("""
-                SELECT id FROM transactions 
+            cursor.execute(f"""
+                SELECT category_id, {amount}, transaction_date FROM transactions 
                 WHERE id = ? AND user_id = ?
             """, (transaction_id, user_id))
             
-            if not cursor.fetchone():
+            row = cursor.fetchone()
+            if not row:
                 conn.close()
                 return False
             
@@ -283,11 +773,464 @@ class Database:
                 DELETE FROM transactions 
                 WHERE id = ? AND user_id = ?
             """, (transaction_id, user_id))
+            deleted = cursor.rowcount > 0
+            
+            if deleted:
+                entries = [(user_id, row[0], -row[1], row[2])]
+                self._add_to_monthly_totals(cursor, entries)
+                self._update_budget_alerts(cursor, entries)
             
             conn.commit()
-            return cursor.rowcount > 0
+            return deleted
         except Exception as e:
             print(f"Error deleting transaction: {e}")
             return False
         finally:
             conn.close()
+
+    def get_period_summaries(self, start_date: str, end_date: str) -> Dict[int, List[Tuple[str, Decimal]]]:
+        """Получить статистику по категориям за период сразу для всех пользователей"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        amount = self._amount_sql("t.")
+
+        cursor.execute(f"""
+            SELECT t.user_id, c.name, SUM({amount}) as total
+            FROM transactions t
+            JOIN categories c ON t.category_id = c.id
+            WHERE t.transaction_date >= ? AND t.transaction_date < ?
+            GROUP BY t.user_id, c.id, c.name
+            HAVING total > 0
+            ORDER BY t.user_id, total DESC
+        """, (start_date, end_date))
+
+        summaries = {}
+        for row in cursor:
+            summaries.setdefault(row[0], []).append((row[1], from_kopecks(row[2])))
+        conn.close()
+        return summaries
+
+    def enqueue_digests(self, digest_key: str, messages: List[Tuple[int, str]]) -> int:
+        """Поставить дайджесты в очередь рассылки (повторная постановка игнорируется)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            # Завершенные рассылки за прошлые периоды того же вида больше не нужны.
+            # Последнюю рассылку каждого вида храним: по ней видно, что период уже разослан.
+            kind = digest_key.split("_", 1)[0]
+            cursor.execute("""
+                DELETE FROM digest_queue
+                WHERE digest_key != ? AND digest_key LIKE ? AND status != 'pending'
+            """, (digest_key, f"{kind}_%"))
+
+            cursor.executemany("""
+                INSERT OR IGNORE INTO digest_queue (digest_key, user_id, text)
+                VALUES (?, ?, ?)
+            """, [(digest_key, user_id, text) for user_id, text in messages])
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def has_digest(self, digest_key: str) -> bool:
+        """Проверить, ставилась ли рассылка в очередь"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT 1 FROM digest_queue WHERE digest_key = ? LIMIT 1", (digest_key,))
+        exists = cursor.fetchone() is not None
+        conn.close()
+        return exists
+
+    def get_pending_digests(self, limit: int = 100) -> List[Tuple[str, int, str]]:
+        """Получить неотправленные дайджесты"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT digest_key, user_id, text
+            FROM digest_queue
+            WHERE status = 'pending'
+            ORDER BY digest_key, user_id
+            LIMIT ?
+        """, (limit,))
+
+        results = [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+        conn.close()
+        return results
+
+    def mark_digest(self, digest_key: str, user_id: int, status: str = 'sent'):
+        """Отметить дайджест как отправленный (или неудачный)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            UPDATE digest_queue SET status = ?
+            WHERE digest_key = ? AND user_id = ?
+        """, (status, digest_key, user_id))
+
+        conn.commit()
+        conn.close()
+
+    def create_group(self, owner_id: int, name: str, display_name: str = "") -> int:
+        """Создать группу и добавить в нее владельца. Возвращает ID группы"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                INSERT INTO ledger_groups (name, owner_id, invite_code)
+                VALUES (?, ?, ?)
+            """, (name, owner_id, secrets.token_urlsafe(6)))
+            group_id = cursor.lastrowid
+
+            cursor.execute("""
+                INSERT INTO group_members (group_id, user_id, display_name)
+                VALUES (?, ?, ?)
+            """, (group_id, owner_id, display_name))
+            conn.commit()
+            return group_id
+        finally:
+            conn.close()
+
+    def join_group(self, user_id: int, invite_code: str, display_name: str = "") -> Optional[int]:
+        """Вступить в группу по коду приглашения. Возвращает ID группы"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT id FROM ledger_groups WHERE invite_code = ?
+            """, (invite_code,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+
+            cursor.execute("""
+                INSERT OR IGNORE INTO group_members (group_id, user_id, display_name)
+                VALUES (?, ?, ?)
+            """, (row[0], user_id, display_name))
+            conn.commit()
+            return row[0]
+        finally:
+            conn.close()
+
+    def leave_group(self, group_id: int, user_id: int) -> bool:
+        """Выйти из группы. Группа без участников удаляется"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                DELETE FROM group_members WHERE group_id = ? AND user_id = ?
+            """, (group_id, user_id))
+            left = cursor.rowcount > 0
+
+            cursor.execute("""
+                DELETE FROM ledger_groups
+                WHERE id = ? AND NOT EXISTS (SELECT 1 FROM group_members WHERE group_id = ?)
+            """, (group_id, group_id))
+            conn.commit()
+            return left
+        finally:
+            conn.close()
+
+    def get_user_groups(self, user_id: int) -> List[Tuple[int, str]]:
+        """Получить группы пользователя"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT g.id, g.name
+            FROM group_members m
+            JOIN ledger_groups g ON g.id = m.group_id
+            WHERE m.user_id = ?
+            ORDER BY g.name
+        """, (user_id,))
+
+        results = [(row[0], row[1]) for row in cursor.fetchall()]
+        conn.close()
+        return results
+
+    def get_group(self, group_id: int, user_id: int) -> Optional[Tuple[int, str, str, int]]:
+        """Получить группу (ID, название, код приглашения, число участников), если пользователь в ней состоит"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT g.id, g.name, g.invite_code,
+                   (SELECT COUNT(*) FROM group_members WHERE group_id = g.id)
+            FROM ledger_groups g
+            JOIN group_members m ON m.group_id = g.id AND m.user_id = ?
+            WHERE g.id = ?
+        """, (user_id, group_id))
+
+        row = cursor.fetchone()
+        conn.close()
+        return (row[0], row[1], row[2], row[3]) if row else None
+
+    def add_group_category(self, group_id: int, user_id: int, category_name: str) -> bool:
+        """Добавить категорию группы (видна всем участникам)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        category_name = category_name.upper()
+
+        try:
+            cursor.execute("""
+                SELECT 1 FROM group_members WHERE group_id = ? AND user_id = ?
+            """, (group_id, user_id))
+            if not cursor.fetchone():
+                return False
+
+            # Общая категория с таким названием и так видна всем участникам
+            cursor.execute("""
+                SELECT 1 FROM categories WHERE name = ? AND user_id = 0 AND group_id IS NULL
+            """, (category_name,))
+            if cursor.fetchone():
+                return False
+
+            cursor.execute("""
+                INSERT INTO categories (name, user_id, group_id)
+                VALUES (?, ?, ?)
+            """, (category_name, user_id, group_id))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            conn.close()
+
+    def get_group_statistics(self, group_id: int, month: Optional[str] = None) -> List[Tuple[str, Decimal]]:
+        """Получить статистику группы по категориям за месяц (ГГГГ-ММ) или за все время"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # Суммы берутся из monthly_totals: объем работы зависит от числа
+        # участников и категорий, а не от числа транзакций
+        cursor.execute("""
+            SELECT c.name, SUM(t.total_kopecks) as total
+            FROM group_members m
+            JOIN monthly_totals t ON t.user_id = m.user_id
+            JOIN categories c ON c.id = t.category_id
+            WHERE m.group_id = ? AND (? IS NULL OR t.month = ?)
+            GROUP BY c.id, c.name
+            HAVING total > 0
+            ORDER BY total DESC
+        """, (group_id, month, month))
+
+        results = [(row[0], from_kopecks(row[1])) for row in cursor.fetchall()]
+        conn.close()
+        return results
+
+    def get_group_member_totals(self, group_id: int, month: Optional[str] = None) -> List[Tuple[str, Decimal]]:
+        """Получить суммы участников группы за месяц (ГГГГ-ММ) или за все время"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT m.display_name, COALESCE(SUM(t.total_kopecks), 0) as total
+            FROM group_members m
+            LEFT JOIN monthly_totals t ON t.user_id = m.user_id AND (? IS NULL OR t.month = ?)
+            WHERE m.group_id = ?
+            GROUP BY m.user_id, m.display_name
+            ORDER BY total DESC
+        """, (month, month, group_id))
+
+        results = [(row[0], from_kopecks(row[1])) for row in cursor.fetchall()]
+        conn.close()
+        return results
+
+    def add_recurring_rule(self, user_id: int, category_id: int, amount: Decimal,
+                           kind: str, value: int, today: Optional[date] = None) -> bool:
+        """Добавить правило регулярного дохода"""
+        next_run = first_run_date(kind, value, today or date.today())
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                INSERT INTO recurring_rules (user_id, category_id, amount_kopecks, kind, value, next_run)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (user_id, category_id, to_kopecks(amount), kind, value, next_run.isoformat()))
+            conn.commit()
+            return True
+        finally:
+            conn.close()
+
+    def get_recurring_rules(self, user_id: int) -> List[Tuple[int, str, Decimal, str, int, str]]:
+        """Получить правила пользователя (ID, категория, сумма, вид, значение, следующая дата)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT r.id, c.name, r.amount_kopecks, r.kind, r.value, r.next_run
+            FROM recurring_rules r
+            JOIN categories c ON c.id = r.category_id
+            WHERE r.user_id = ?
+            ORDER BY r.next_run
+        """, (user_id,))
+
+        results = [(row[0], row[1], from_kopecks(row[2]), row[3], row[4], row[5])
+                   for row in cursor.fetchall()]
+        conn.close()
+        return results
+
+    def delete_recurring_rule(self, rule_id: int, user_id: int) -> bool:
+        """Удалить правило регулярного дохода"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            DELETE FROM recurring_rules WHERE id = ? AND user_id = ?
+        """, (rule_id, user_id))
+
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+
+    def materialize_recurring(self, today: Optional[date] = None) -> int:
+        """Создать транзакции по всем наступившим правилам одной транзакцией БД.
+
+        Пропущенные за время простоя даты добавляются все сразу. Сдвиг next_run
+        происходит в той же транзакции, что и вставка, поэтому повторный запуск
+        не создает дубликатов. Возвращает число созданных транзакций.
+        """
+        today = today or date.today()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            # Берем блокировку на запись сразу, чтобы параллельный запуск не прочитал те же правила
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                SELECT id, user_id, category_id, amount_kopecks, kind, value, next_run
+                FROM recurring_rules
+                WHERE next_run <= ?
+            """, (today.isoformat(),))
+
+            transactions = []
+            updates = []
+            for rule_id, user_id, category_id, kopecks, kind, value, next_run in cursor.fetchall():
+                run = date.fromisoformat(next_run)
+                while run <= today:
+                    transactions.append((user_id, category_id, kopecks, run.isoformat()))
+                    run = next_run_date(kind, value, run)
+                updates.append((run.isoformat(), rule_id))
+
+            if transactions:
+                self._insert_transactions(cursor, transactions)
+            cursor.executemany("""
+                UPDATE recurring_rules SET next_run = ? WHERE id = ?
+            """, updates)
+            conn.commit()
+            return len(transactions)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def set_budget_target(self, user_id: int, category_id: int, amount: Decimal) -> bool:
+        """Установить месячную цель по категории (category_id = 0 - по всем категориям)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                INSERT INTO budget_targets (user_id, category_id, target_kopecks)
+                VALUES (?, ?, ?)
+                ON CONFLICT (user_id, category_id)
+                DO UPDATE SET target_kopecks = excluded.target_kopecks
+            """, (user_id, category_id, to_kopecks(amount)))
+            self._budget_users.add(user_id)
+
+            # Цель могла быть достигнута уже в текущем месяце
+            self._update_budget_alerts(cursor, [(user_id, category_id, 0, date.today().isoformat())])
+            conn.commit()
+            return True
+        finally:
+            conn.close()
+
+    def delete_budget_target(self, user_id: int, category_id: int) -> bool:
+        """Удалить цель"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                DELETE FROM budget_targets WHERE user_id = ? AND category_id = ?
+            """, (user_id, category_id))
+            deleted = cursor.rowcount > 0
+
+            cursor.execute("""
+                DELETE FROM budget_alerts WHERE user_id = ? AND category_id = ? AND notified = 0
+            """, (user_id, category_id))
+
+            cursor.execute("SELECT 1 FROM budget_targets WHERE user_id = ? LIMIT 1", (user_id,))
+            if not cursor.fetchone():
+                self._budget_users.discard(user_id)
+
+            conn.commit()
+            return deleted
+        finally:
+            conn.close()
+
+    def get_budget_targets(self, user_id: int, month: str) -> List[Tuple[int, Optional[str], Decimal, Decimal]]:
+        """Получить цели пользователя с прогрессом за месяц (ГГГГ-ММ):
+        (ID категории, название или None для общей цели, цель, текущая сумма)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT b.category_id, c.name, b.target_kopecks,
+                   (SELECT COALESCE(SUM(t.total_kopecks), 0) FROM monthly_totals t
+                    WHERE t.user_id = b.user_id AND t.month = ?
+                    AND (b.category_id = 0 OR t.category_id = b.category_id))
+            FROM budget_targets b
+            LEFT JOIN categories c ON c.id = b.category_id
+            WHERE b.user_id = ?
+            ORDER BY b.category_id != 0, c.name
+        """, (month, user_id))
+
+        results = [(row[0], row[1], from_kopecks(row[2]), from_kopecks(row[3])) for row in cursor.fetchall()]
+        conn.close()
+        return results
+
+    def take_budget_alerts(self, user_id: Optional[int] = None) -> List[Tuple[int, Optional[str], str, int, Decimal]]:
+        """Забрать неотправленные уведомления о целях (пользователя или всех):
+        (user_id, категория или None, месяц ГГГГ-ММ, порог, цель)"""
+        if user_id is not None and user_id not in self._alert_users:
+            return []
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            # Блокируем запись, чтобы новое уведомление не отметилось как отправленное
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                SELECT a.user_id, c.name, a.month, a.threshold, COALESCE(b.target_kopecks, 0)
+                FROM budget_alerts a
+                LEFT JOIN categories c ON c.id = a.category_id
+                LEFT JOIN budget_targets b ON b.user_id = a.user_id AND b.category_id = a.category_id
+                WHERE a.notified = 0 AND (? IS NULL OR a.user_id = ?)
+                ORDER BY a.user_id, a.month, a.threshold
+            """, (user_id, user_id))
+            alerts = [(row[0], row[1], row[2], row[3], from_kopecks(row[4])) for row in cursor.fetchall()]
+
+            cursor.execute("""
+                UPDATE budget_alerts SET notified = 1
+                WHERE notified = 0 AND (? IS NULL OR user_id = ?)
+            """, (user_id, user_id))
+            conn.commit()
+
+            if user_id is None:
+                self._alert_users.clear()
+            else:
+                self._alert_users.discard(user_id)
+            return alerts
+        finally:
+            conn.close()
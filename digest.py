@@ -0,0 +1,104 @@
+import asyncio
+import html
+import logging
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import List, Tuple
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Скорость рассылки (сообщений в секунду). Лимит Telegram — около 30 в секунду,
+# оставляем запас для ответов пользователям.
+DIGEST_RATE = 20
+
+# Сколько дайджестов читать из очереди за один запрос
+DIGEST_BATCH = 200
+
+# Еженедельный дайджест (по понедельникам за прошедшую неделю)
+DIGEST_WEEKLY = False
+
+# Сколько дней после начала месяца досылать пропущенный месячный дайджест
+# (если бот не работал 1-го числа)
+DIGEST_CATCHUP_DAYS = 7
+
+# Не даем двум рассылкам идти одновременно
+_delivery_lock = asyncio.Lock()
+
+
+def previous_month_period(today: date) -> Tuple[date, date]:
+    """Получить границы прошлого месяца [начало, конец)"""
+    end = today.replace(day=1)
+    start = (end - timedelta(days=1)).replace(day=1)
+    return start, end
+
+
+def previous_week_period(today: date) -> Tuple[date, date]:
+    """Получить границы прошлой недели (пн-вс) [начало, конец)"""
+    end = today - timedelta(days=today.weekday())
+    return end - timedelta(days=7), end
+
+
+def format_digest(title: str, stats: List[Tuple[str, Decimal]]) -> str:
+    """Сформировать текст дайджеста"""
+    total = sum(amount for _, amount in stats)
+    text = f"📬 <b>{title}</b>\n\n"
+    for category, amount in stats:
+        percentage = (amount / total * 100) if total > 0 else 0
+        text += f"<b>{html.escape(category)}</b>: {amount:,.2f} ₽ ({percentage:.1f}%)\n"
+    text += f"\n<b>Итого:</b> {total:,.2f} ₽"
+    return text
+
+
+def prepare_digest(db: Database, digest_key: str, title: str, start: date, end: date) -> int:
+    """Посчитать итоги за период одним запросом и поставить дайджесты в очередь"""
+    summaries = db.get_period_summaries(start.isoformat(), end.isoformat())
+    messages = [
+        (user_id, format_digest(title, stats))
+        for user_id, stats in summaries.items()
+    ]
+    queued = db.enqueue_digests(digest_key, messages)
+    logger.info(f"Дайджест {digest_key}: в очередь поставлено {queued} сообщений")
+    return queued
+
+
+async def deliver_pending_digests(bot, db: Database) -> int:
+    """Разослать дайджесты из очереди с ограничением скорости.
+
+    Каждое сообщение отмечается в базе сразу после отправки, поэтому после
+    перезапуска рассылка продолжается с того места, где остановилась.
+    """
+    if _delivery_lock.locked():
+        return 0
+
+    sent = 0
+    async with _delivery_lock:
+        while True:
+            batch = await asyncio.to_thread(db.get_pending_digests, DIGEST_BATCH)
+            if not batch:
+                break
+
+            for digest_key, user_id, text in batch:
+                try:
+                    await bot.send_message(user_id, text, parse_mode='HTML')
+                    status = 'sent'
+                    sent += 1
+                except RetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except (Forbidden, BadRequest) as e:
+                    # Пользователь заблокировал бота или чат недоступен
+                    logger.debug(f"Дайджест для {user_id} не доставлен: {e}")
+                    status = 'failed'
+                except TelegramError as e:
+                    logger.warning(f"Рассылка дайджестов прервана: {e}")
+                    return sent
+
+                await asyncio.to_thread(db.mark_digest, digest_key, user_id, status)
+                await asyncio.sleep(1 / DIGEST_RATE)
+
+    logger.info(f"Рассылка дайджестов завершена, отправлено: {sent}")
+    return sent
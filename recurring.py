@@ -0,0 +1,62 @@
+import re
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+
+# Виды регулярных правил
+RECURRING_MONTHLY = "monthly"    # каждый месяц N-го числа
+RECURRING_WEEKLY = "weekly"      # каждую неделю в день N (1 - понедельник, 7 - воскресенье)
+RECURRING_INTERVAL = "interval"  # каждые N дней
+
+WEEKDAY_NAMES = {
+    1: "понедельникам", 2: "вторникам", 3: "средам", 4: "четвергам",
+    5: "пятницам", 6: "субботам", 7: "воскресеньям"
+}
+
+_SCHEDULE_PATTERNS = [
+    (re.compile(r"^(?:месяц|ежемесячно)\s+(\d{1,2})$"), RECURRING_MONTHLY, 1, 31),
+    (re.compile(r"^(?:неделя|еженедельно)\s+(\d)$"), RECURRING_WEEKLY, 1, 7),
+    (re.compile(r"^(?:дни|каждые)\s+(\d{1,3})(?:\s+дн\w*)?$"), RECURRING_INTERVAL, 1, 366),
+]
+
+
+def parse_schedule(text: str) -> Optional[Tuple[str, int]]:
+    """Разобрать расписание вида 'месяц 10', 'неделя 1' или 'дни 14'"""
+    text = " ".join(text.strip().lower().split())
+    for pattern, kind, low, high in _SCHEDULE_PATTERNS:
+        match = pattern.match(text)
+        if match and low <= int(match.group(1)) <= high:
+            return kind, int(match.group(1))
+    return None
+
+
+def describe_schedule(kind: str, value: int) -> str:
+    """Описание расписания для пользователя"""
+    if kind == RECURRING_MONTHLY:
+        return f"каждый месяц {value}-го числа"
+    if kind == RECURRING_WEEKLY:
+        return f"каждую неделю по {WEEKDAY_NAMES[value]}"
+    return f"каждые {value} дн."
+
+
+def first_run_date(kind: str, value: int, today: date) -> date:
+    """Дата первого срабатывания правила (не раньше сегодняшней)"""
+    if kind == RECURRING_MONTHLY:
+        # relativedelta(day=31) в коротком месяце дает последний день месяца
+        run = today + relativedelta(day=value)
+        if run < today:
+            run = today + relativedelta(months=1, day=value)
+        return run
+    if kind == RECURRING_WEEKLY:
+        return today + timedelta(days=(value - today.isoweekday()) % 7)
+    return today
+
+
+def next_run_date(kind: str, value: int, current: date) -> date:
+    """Дата следующего срабатывания после current"""
+    if kind == RECURRING_MONTHLY:
+        return current + relativedelta(months=1, day=value)
+    if kind == RECURRING_WEEKLY:
+        return current + timedelta(days=7)
+    return current + timedelta(days=value)
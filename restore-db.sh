@@ -8,6 +8,7 @@ if [ -z "$BACKUP_FILE" ]; then
     echo "Использование: $0 <путь_к_файлу_бэкапа.db>"
     echo ""
     echo "Пример:"
+    echo "  $0 backups/income_bot_20260204_123456.db.gz"
     echo "  $0 backups/income_bot_20260204_123456.db"
     echo "  $0 /path/to/income_bot.db"
     exit 1
@@ -41,7 +42,11 @@ fi
 
 # Восстанавливаем из бэкапа
 echo "📥 Восстановление базы данных из $BACKUP_FILE..."
-cp "$BACKUP_FILE" "$DB_FILE"
+if [[ "$BACKUP_FILE" == *.gz ]]; then
+    gunzip -c "$BACKUP_FILE" > "$DB_FILE"
+else
+    cp "$BACKUP_FILE" "$DB_FILE"
+fi
 
 # Устанавливаем правильные права
 chmod 644 "$DB_FILE"
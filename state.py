@@ -0,0 +1,113 @@
+import logging
+import resource
+import time
+from collections import OrderedDict
+from typing import Dict
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+# Незавершенный диалог (выбрали категорию и ушли) сбрасывается через это время (в секундах)
+CONVERSATION_TIMEOUT = 15 * 60
+
+# Данные пользователя/чата удаляются после этого времени без активности (в секундах).
+# Должно быть больше CONVERSATION_TIMEOUT, чтобы не терять данные идущего диалога.
+STATE_TTL = 60 * 60
+
+# Жесткий лимит отслеживаемых пользователей и чатов: сверх него удаляются давно неактивные
+STATE_MAX_ENTRIES = 10000
+
+# Как часто проверять устаревшие данные (в секундах)
+STATE_SWEEP_INTERVAL = 5 * 60
+
+
+def current_rss_kb() -> int:
+    """Текущий объем резидентной памяти процесса (в КБ)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() // 1024
+    except (OSError, ValueError, IndexError):
+        # Не Linux: пиковое значение вместо текущего
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StateManager:
+    """Ограничивает память под user_data/chat_data: TTL по активности и LRU-лимит"""
+
+    def __init__(self, ttl: float = STATE_TTL, max_entries: int = STATE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # id -> время последней активности, от давних к недавним
+        self._users = OrderedDict()
+        self._chats = OrderedDict()
+
+    async def touch(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        """Отметить активность пользователя и чата (вызывается для каждого обновления)"""
+        if not isinstance(update, Update):
+            return
+
+        now = time.monotonic()
+        if update.effective_user:
+            self._users[update.effective_user.id] = now
+            self._users.move_to_end(update.effective_user.id)
+        if update.effective_chat:
+            self._chats[update.effective_chat.id] = now
+            self._chats.move_to_end(update.effective_chat.id)
+
+    def _evict(self, tracked: OrderedDict, drop, now: float) -> int:
+        """Удалить записи старше TTL и лишние сверх лимита (самые давние - первыми)"""
+        evicted = 0
+        while tracked:
+            key, last_seen = next(iter(tracked.items()))
+            if now - last_seen < self.ttl and len(tracked) <= self.max_entries:
+                break
+            del tracked[key]
+            drop(key)
+            evicted += 1
+        return evicted
+
+    def sweep(self, application: Application) -> int:
+        """Удалить устаревшие данные пользователей и чатов"""
+        now = time.monotonic()
+
+        # Данные без активности (например, созданные заново по таймауту диалога после
+        # удаления) считаем устаревшими: в начало очереди с истекшим сроком, чтобы
+        # порядок от давних к недавним, на который опирается _evict, не нарушался
+        expired = now - self.ttl
+        for user_id in application.user_data.keys() - self._users.keys():
+            self._users[user_id] = expired
+            self._users.move_to_end(user_id, last=False)
+        for chat_id in application.chat_data.keys() - self._chats.keys():
+            self._chats[chat_id] = expired
+            self._chats.move_to_end(chat_id, last=False)
+
+        evicted = self._evict(self._users, application.drop_user_data, now)
+        evicted += self._evict(self._chats, application.drop_chat_data, now)
+        return evicted
+
+    async def sweep_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Задача планировщика: периодическая очистка"""
+        evicted = self.sweep(context.application)
+        if evicted:
+            logger.info(f"Очистка состояния: удалено записей: {evicted}, {self.gauges(context.application)}")
+
+    def gauges(self, application: Application) -> Dict[str, int]:
+        """Показатели памяти: отслеживаемые пользователи, диалоги, RSS"""
+        conversations = 0
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, ConversationHandler):
+                    # Публичного API для числа активных диалогов нет
+                    conversations += len(getattr(handler, "_conversations", ()))
+
+        return {
+            "users": len(self._users),
+            "chats": len(self._chats),
+            "user_data": len(application.user_data),
+            "chat_data": len(application.chat_data),
+            "conversations": conversations,
+            "rss_kb": current_rss_kb(),
+        }
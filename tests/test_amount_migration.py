@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+# Схема базы до перехода на копейки
+LEGACY_SCHEMA = """
+    CREATE TABLE categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        user_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        transaction_date DATE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (category_id) REFERENCES categories(id)
+    );
+    INSERT INTO categories (name, user_id) VALUES ('ЗАРПЛАТА', 0);
+"""
+
+USER_ID = 1
+
+
+class AmountMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "income_bot.db")
+
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(LEGACY_SCHEMA)
+        # Суммы, на которых округление float и Decimal расходится
+        for amount in (1.005, 0.285, 0.1, 0.2, 5.0):
+            conn.execute("""
+                INSERT INTO transactions (user_id, category_id, amount, transaction_date)
+                VALUES (?, 1, ?, '2026-09-01')
+            """, (USER_ID, amount))
+        # Удаленная последняя запись: ее ID не должен использоваться повторно
+        conn.execute("DELETE FROM transactions WHERE amount = 5.0")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def columns(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return {row[1] for row in conn.execute("PRAGMA table_info(transactions)")}
+        finally:
+            conn.close()
+
+    def test_totals_do_not_change_during_migration(self):
+        db = Database(self.db_path)
+        self.assertFalse(db.amounts_migrated)
+        self.assertEqual(db.get_total_amount(USER_ID), Decimal("1.60"))
+
+        self.assertEqual(db.migrate_amounts(batch_size=2), 2)
+        self.assertEqual(db.get_total_amount(USER_ID), Decimal("1.60"))
+
+        while db.migrate_amounts(batch_size=2):
+            pass
+        self.assertTrue(db.amounts_migrated)
+        self.assertEqual(db.get_total_amount(USER_ID), Decimal("1.60"))
+
+    def test_legacy_column_dropped_on_next_start(self):
+        db = Database(self.db_path)
+        db.add_transaction(USER_ID, "ЗАРПЛАТА", Decimal("2.00"), "2026-09-02")
+        while db.migrate_amounts():
+            pass
+
+        # Пока бот работает, колонка остается и новые записи ее заполняют
+        self.assertIn("amount", self.columns())
+        self.assertTrue(db.add_transaction(USER_ID, "ЗАРПЛАТА", Decimal("0.50"), "2026-09-02"))
+
+        # При следующем запуске колонка удаляется
+        db = Database(self.db_path)
+        self.assertNotIn("amount", self.columns())
+        self.assertEqual(db.get_total_amount(USER_ID), Decimal("4.10"))
+
+        # Новые записи пишутся без старой колонки и не переиспользуют ID удаленных
+        self.assertTrue(db.add_transaction(USER_ID, "ЗАРПЛАТА", Decimal("1.00"), "2026-09-03"))
+        conn = sqlite3.connect(self.db_path)
+        try:
+            ids = [row[0] for row in conn.execute("SELECT id FROM transactions ORDER BY id")]
+            indexes = {row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'transactions'"
+            )}
+        finally:
+            conn.close()
+        self.assertEqual(ids, [1, 2, 3, 4, 6, 7, 8])
+        self.assertIn("idx_transactions_user", indexes)
+        self.assertEqual(db.get_total_amount(USER_ID), Decimal("5.10"))
+
+    def test_migrated_database_drops_column_on_startup(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("ALTER TABLE transactions ADD COLUMN amount_kopecks INTEGER")
+        conn.execute("UPDATE transactions SET amount_kopecks = CAST(ROUND(amount * 100) AS INTEGER)")
+        conn.commit()
+        conn.close()
+
+        db = Database(self.db_path)
+        self.assertTrue(db.amounts_migrated)
+        self.assertNotIn("amount", self.columns())
+
+
+if __name__ == '__main__':
+    unittest.main()
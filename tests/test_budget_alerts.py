@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+USER_ID = 1
+
+
+class BudgetAlertsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmpdir.name, "income_bot.db"))
+        self.category_id = self.db.get_category_id(USER_ID, "ПТТ")
+        self.db.set_budget_target(USER_ID, self.category_id, Decimal("1000"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def add(self, amount: str, transaction_date: str = "2026-10-05"):
+        self.assertTrue(self.db.add_transaction(USER_ID, "ПТТ", Decimal(amount), transaction_date,
+                                                self.category_id))
+
+    def thresholds(self):
+        return [(alert[2], alert[3]) for alert in self.db.take_budget_alerts(USER_ID)]
+
+    def test_each_threshold_fires_once_per_month(self):
+        self.add("400")
+        self.assertEqual(self.thresholds(), [])
+
+        self.add("200")
+        self.assertEqual(self.thresholds(), [("2026-10", 50)])
+        self.assertEqual(self.thresholds(), [])
+
+        # Порог уже пройден: повторно не уведомляем
+        self.add("100")
+        self.assertEqual(self.thresholds(), [])
+
+        self.add("400")
+        self.assertEqual(self.thresholds(), [("2026-10", 100)])
+
+        # В следующем месяце пороги считаются заново
+        self.add("1000", "2026-11-02")
+        self.assertEqual(self.thresholds(), [("2026-11", 50), ("2026-11", 100)])
+
+    def test_alert_withdrawn_when_transaction_deleted_before_sending(self):
+        self.add("300")
+        self.add("300")
+        transaction_id = self.db.get_recent_transactions(USER_ID)[0][0]
+
+        self.assertTrue(self.db.delete_transaction(transaction_id, USER_ID))
+        self.assertEqual(self.thresholds(), [])
+
+        # Порог снова достигнут - уведомление приходит один раз
+        self.add("300")
+        self.assertEqual(self.thresholds(), [("2026-10", 50)])
+
+    def test_total_target_counts_all_categories(self):
+        self.db.set_budget_target(USER_ID, 0, Decimal("100"))
+        other_id = self.db.get_category_id(USER_ID, "СТАНКИ")
+        self.db.add_transaction(USER_ID, "СТАНКИ", Decimal("60"), "2026-10-05", other_id)
+
+        alerts = self.db.take_budget_alerts(USER_ID)
+        self.assertEqual([(alert[1], alert[3]) for alert in alerts], [(None, 50)])
+
+
+if __name__ == '__main__':
+    unittest.main()
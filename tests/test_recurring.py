@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from recurring import RECURRING_MONTHLY, RECURRING_WEEKLY  # noqa: E402
+
+USER_ID = 1
+
+
+class MaterializeRecurringTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmpdir.name, "income_bot.db"))
+        self.category_id = self.db.get_category_id(USER_ID, "ПТТ")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def transaction_dates(self):
+        return sorted(row[3] for row in self.db.get_recent_transactions(USER_ID, limit=100))
+
+    def test_catch_up_clamps_day_31_to_month_end(self):
+        self.db.add_recurring_rule(USER_ID, self.category_id, Decimal("1000"), RECURRING_MONTHLY, 31,
+                                   today=date(2026, 1, 15))
+
+        # Бот не работал три месяца: все пропущенные даты добавляются за один запуск
+        self.assertEqual(self.db.materialize_recurring(today=date(2026, 4, 30)), 4)
+        self.assertEqual(self.transaction_dates(), ["2026-01-31", "2026-02-28", "2026-03-31", "2026-04-30"])
+
+        # 28 февраля не "прилипает": после короткого месяца снова последний день
+        next_run = self.db.get_recurring_rules(USER_ID)[0][5]
+        self.assertEqual(next_run, "2026-05-31")
+        self.assertEqual(self.db.get_total_amount(USER_ID), Decimal("4000.00"))
+
+    def test_repeated_run_does_not_duplicate(self):
+        self.db.add_recurring_rule(USER_ID, self.category_id, Decimal("250.50"), RECURRING_WEEKLY, 1,
+                                   today=date(2026, 10, 5))
+
+        self.assertEqual(self.db.materialize_recurring(today=date(2026, 10, 19)), 3)
+        self.assertEqual(self.db.materialize_recurring(today=date(2026, 10, 19)), 0)
+        self.assertEqual(self.db.materialize_recurring(today=date(2026, 10, 25)), 0)
+        self.assertEqual(self.transaction_dates(), ["2026-10-05", "2026-10-12", "2026-10-19"])
+        self.assertEqual(self.db.get_total_amount(USER_ID), Decimal("751.50"))
+
+    def test_rule_not_due_yet(self):
+        self.db.add_recurring_rule(USER_ID, self.category_id, Decimal("100"), RECURRING_MONTHLY, 25,
+                                   today=date(2026, 10, 19))
+
+        self.assertEqual(self.db.materialize_recurring(today=date(2026, 10, 24)), 0)
+        self.assertEqual(self.db.materialize_recurring(today=date(2026, 10, 25)), 1)
+        self.assertEqual(self.transaction_dates(), ["2026-10-25"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,346 @@
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ConversationHandler
+from telegram.request import BaseRequest
+
+logger = logging.getLogger(__name__)
+
+# Объекты обновления, в которых есть ID и имена пользователей/чатов
+TRACE_IDENTITY_KEYS = ("from", "user", "chat", "sender_chat", "forward_from", "forward_from_chat")
+
+# Поля с личными данными, которые не пишутся в трассировку
+TRACE_PRIVATE_FIELDS = ("last_name", "username", "title", "bio", "phone_number")
+
+# Сообщение, похожее на сумму (его значение можно исказить)
+AMOUNT_RE = re.compile(r"^\s*(\d+(?:[.,]\d{1,2})?)\s*$")
+
+# Токен и профиль бота для воспроизведения
+REPLAY_TOKEN = "123456:REPLAY"
+REPLAY_BOT = {"id": 123456, "is_bot": True, "first_name": "Replay", "username": "replay_bot"}
+
+# Методы Bot API, которые возвращают сообщение
+MESSAGE_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup"}
+
+# Только эти запросы считаются обращениями к БД (без BEGIN/COMMIT)
+DB_QUERY_PREFIXES = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def anonymize_id(value: int, salt: str) -> int:
+    """Заменить ID пользователя или чата хешем (0 - общие категории - не меняется)"""
+    if not value:
+        return value
+    digest = hmac.new(salt.encode(), str(abs(value)).encode(), hashlib.sha256).digest()
+    anonymized = int.from_bytes(digest[:6], "big") + 1
+    return anonymized if value > 0 else -anonymized
+
+
+class TraceRecorder:
+    """Пишет входящие обновления в JSONL-трассировку без личных данных"""
+
+    def __init__(self, path: str, salt: str, amount_jitter: float = 0.0):
+        if not salt:
+            # Без постоянной соли трассировку нельзя сопоставить с копией базы при воспроизведении
+            raise ValueError("Для записи трассировки нужна соль (TRACE_SALT)")
+        self.salt = salt
+        self.amount_jitter = amount_jitter
+        self._random = random.Random()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def anonymize(self, data, key: str = ""):
+        """Убрать личные данные из словаря обновления"""
+        if isinstance(data, list):
+            return [self.anonymize(item, key) for item in data]
+        if not isinstance(data, dict):
+            return data
+
+        result = {}
+        for field, value in data.items():
+            if field in TRACE_PRIVATE_FIELDS:
+                continue
+            if field == "id" and key in TRACE_IDENTITY_KEYS:
+                value = anonymize_id(value, self.salt)
+            elif field == "first_name":
+                value = "User"
+            elif field == "text" and key == "message":
+                value = self._jitter_amount(value)
+            elif field == "message" and key == "callback_query":
+                # Текст сообщения бота не нужен обработчикам и может содержать чужие имена
+                value = {k: v for k, v in value.items() if k not in ("text", "reply_markup", "entities")}
+            result[field] = self.anonymize(value, field)
+        return result
+
+    def _jitter_amount(self, text: str) -> str:
+        """Исказить сумму на ±amount_jitter (доля), если сообщение - число"""
+        match = AMOUNT_RE.match(text)
+        if not match or not self.amount_jitter:
+            return text
+        amount = float(match.group(1).replace(",", "."))
+        amount *= 1 + self._random.uniform(-self.amount_jitter, self.amount_jitter)
+        return f"{max(amount, 0.01):.2f}"
+
+    async def record(self, update: object, context):
+        """Записать обновление (обработчик группы -2)"""
+        if not isinstance(update, Update):
+            return
+        entry = {"ts": time.time(), "update": self.anonymize(update.to_dict())}
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+class FakeBotRequest(BaseRequest):
+    """Поддельный Bot API: отвечает на запросы без сети и считает вызовы"""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = request_data.parameters if request_data else {}
+
+        if api_method == "getMe":
+            result = REPLAY_BOT
+        elif api_method == "getUpdates":
+            result = []
+        elif api_method in MESSAGE_METHODS:
+            result = {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+# Счетчики запросов к БД текущего обработчика и текущего обновления
+_handler_queries = contextvars.ContextVar("handler_queries", default=None)
+_update_queries = contextvars.ContextVar("update_queries", default=None)
+
+
+def _count_query(statement: str):
+    """trace callback SQLite: учесть запрос в счетчиках текущего контекста"""
+    if not statement.lstrip().upper().startswith(DB_QUERY_PREFIXES):
+        return
+    for counter in (_handler_queries.get(), _update_queries.get()):
+        if counter is not None:
+            counter[0] += 1
+
+
+class ReplayStats:
+    """Задержки и число запросов к БД по обработчикам"""
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Tuple[float, int]]] = {}
+        self.updates: List[Tuple[float, int]] = []
+
+    def instrument(self, application: Application):
+        """Обернуть callback всех обработчиков приложения для замеров"""
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                self._instrument_handler(handler)
+
+    def _instrument_handler(self, handler):
+        if isinstance(handler, ConversationHandler):
+            nested = list(handler.entry_points) + list(handler.fallbacks)
+            for state_handlers in handler.states.values():
+                nested += state_handlers
+            for nested_handler in nested:
+                self._instrument_handler(nested_handler)
+            return
+
+        callback = handler.callback
+        if getattr(callback, "_replay_name", None):
+            return
+        name = getattr(callback, "__name__", repr(callback))
+        samples = self.handlers.setdefault(name, [])
+
+        async def timed_callback(update, context):
+            counter = [0]
+            token = _handler_queries.set(counter)
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                samples.append(((time.perf_counter() - started) * 1000, counter[0]))
+                _handler_queries.reset(token)
+
+        timed_callback._replay_name = name
+        handler.callback = timed_callback
+
+    async def process(self, application: Application, update: Update):
+        """Обработать обновление и замерить его целиком"""
+        counter = [0]
+        token = _update_queries.set(counter)
+        started = time.perf_counter()
+        try:
+            await application.process_update(update)
+        finally:
+            self.updates.append(((time.perf_counter() - started) * 1000, counter[0]))
+            _update_queries.reset(token)
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def format_report(stats: ReplayStats, request: FakeBotRequest, elapsed: float) -> str:
+    """Отчет о воспроизведении"""
+    lines = [f"Обновлений: {len(stats.updates)}, время: {elapsed:.2f} с"]
+    if stats.updates:
+        latencies = [latency for latency, _ in stats.updates]
+        queries = sum(count for _, count in stats.updates)
+        lines.append(
+            f"На обновление: среднее {sum(latencies) / len(latencies):.2f} мс, "
+            f"p95 {_percentile(latencies, 95):.2f} мс, запросов к БД {queries / len(latencies):.1f}"
+        )
+
+    lines.append("")
+    lines.append(f"{'обработчик':<28}{'вызовов':>8}{'среднее':>10}{'p50':>10}{'p95':>10}{'макс':>10}{'БД':>8}")
+    for name, samples in sorted(stats.handlers.items(), key=lambda item: -len(item[1])):
+        if not samples:
+            continue
+        latencies = [latency for latency, _ in samples]
+        queries = sum(count for _, count in samples) / len(samples)
+        lines.append(
+            f"{name:<28}{len(samples):>8}{sum(latencies) / len(latencies):>10.2f}"
+            f"{_percentile(latencies, 50):>10.2f}{_percentile(latencies, 95):>10.2f}"
+            f"{max(latencies):>10.2f}{queries:>8.1f}"
+        )
+
+    lines.append("")
+    lines.append("Вызовы Bot API: " + ", ".join(
+        f"{method}={count}" for method, count in sorted(request.calls.items())
+    ))
+    return "\n".join(lines)
+
+
+def anonymize_database(db_path: str, salt: str):
+    """Заменить ID пользователей в копии базы так же, как в трассировке"""
+    conn = sqlite3.connect(db_path)
+    conn.create_function("anonymize_id", 1, lambda value: anonymize_id(value, salt), deterministic=True)
+    try:
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        for table in tables:
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column in ("user_id", "owner_id"):
+                if column in columns:
+                    conn.execute(f"UPDATE {table} SET {column} = anonymize_id({column})")
+            if "display_name" in columns:
+                conn.execute(f"UPDATE {table} SET display_name = 'User'")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+async def replay(trace_path: str, db_path: str, salt: str,
+                 realtime: bool = False, speed: float = 1.0) -> str:
+    """Воспроизвести трассировку на копии базы и вернуть отчет"""
+    if not salt:
+        # Без соли ID в трассировке не совпадут с ID в копии базы
+        raise ValueError("Нужна соль (TRACE_SALT), с которой записана трассировка")
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"База данных не найдена: {db_path}")
+    trace_path = os.path.abspath(trace_path)
+
+    # Копия базы удаляется вместе с временным каталогом после воспроизведения
+    with tempfile.TemporaryDirectory(prefix="replay_") as workdir:
+        replay_db = os.path.join(workdir, "income_bot.db")
+
+        # Согласованная копия базы через backup API (оригинал не меняется)
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(replay_db)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        anonymize_database(replay_db, salt)
+
+        # bot.py открывает income_bot.db в текущей директории при импорте
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            import bot
+
+            original_get_connection = bot.db.get_connection
+
+            def counted_connection():
+                conn = original_get_connection()
+                conn.set_trace_callback(_count_query)
+                return conn
+
+            bot.db.get_connection = counted_connection
+
+            request = FakeBotRequest()
+            application = bot.build_application(REPLAY_TOKEN, request=request, schedule_jobs=False)
+            stats = ReplayStats()
+            stats.instrument(application)
+
+            started = time.perf_counter()
+            async with application:
+                previous_ts = None
+                with open(trace_path, encoding="utf-8") as trace:
+                    for line in trace:
+                        if not line.strip():
+                            continue
+                        entry = json.loads(line)
+                        if realtime and previous_ts is not None:
+                            await asyncio.sleep(max(0.0, entry["ts"] - previous_ts) / speed)
+                        previous_ts = entry["ts"]
+                        await stats.process(application, Update.de_json(entry["update"], application.bot))
+            elapsed = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+
+    return format_report(stats, request, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение трассировки обновлений бота")
+    parser.add_argument("trace", help="файл трассировки (JSONL)")
+    parser.add_argument("--db", default="income_bot.db", help="база данных (используется ее копия)")
+    parser.add_argument("--salt", required=True, help="TRACE_SALT, с которым записана трассировка")
+    parser.add_argument("--realtime", action="store_true", help="сохранять исходные интервалы между обновлениями")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение для --realtime")
+    args = parser.parse_args()
+
+    print(asyncio.run(replay(args.trace, args.db, args.salt, args.realtime, args.speed)))
+
+
+if __name__ == '__main__':
+    main()